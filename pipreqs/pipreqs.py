@@ -3,26 +3,48 @@
 
 Usage:
     pipreqs [options] [<path>]
+    pipreqs build-index [options] <source> <index-file>
 
 Arguments:
     <path>                The path to the directory containing the application
                           files for which a requirements file should be
                           generated (defaults to the current working
                           directory).
+    <source>              A directory of PyPI JSON documents (as served at
+                          <pypi-server>/<project>/json) to index.
+    <index-file>          The package index to create.
+
+Commands:
+    build-index           Build a package index for --index-file.
 
 Options:
     --use-local           Use ONLY local package info instead of querying PyPI.
     --pypi-server <url>   Use custom PyPi server.
+    --pypi-concurrency <n>
+                          Resolve up to <n> imports at the same time on the
+                          PyPI server (default: 8).
     --proxy <url>         Use Proxy, parameter will be passed to requests
                           library. You can also just set the environments
                           parameter in your terminal:
                           $ export HTTP_PROXY="http://10.10.1.10:3128"
                           $ export HTTPS_PROXY="https://10.10.1.10:1080"
     --debug               Print debug information
-    --ignore <dirs>...    Ignore extra directories, each separated by a comma
+    --ignore <dirs>...    Ignore extra files and directories, given as
+                          gitignore-style patterns or existing paths
+                          separated by commas (also read from the
+                          .pipreqsignore file of the project)
     --ignore-errors       Ignore errors while scanning files
     --no-follow-links     Do not follow symbolic links in the project
-    --encoding <charset>  Use encoding parameter for file open
+    --projects            Write a requirements file in each project under
+                          <path>, a directory holding a pyproject.toml,
+                          setup.py or requirements.txt file, walking and
+                          resolving the whole tree once.
+    --git                 Only scan the files known to git, tracked or
+                          untracked but not ignored, instead of walking the
+                          whole directory.
+    --encoding <charset>  Use encoding parameter for file open. Python files
+                          are decoded as they declare (PEP 263), falling back
+                          to <charset> where they are not valid.
     --savepath <file>     Save the list of requirements in the given file
     --print               Output the list of requirements in the standard
                           output
@@ -37,25 +59,97 @@ Options:
                           <gt>     | e.g. Flask>=1.1.2
                           <no-pin> | e.g. Flask
     --scan-notebooks      Look for imports in jupyter notebook files.
+    --watch               Keep the requirements file up to date as the
+                          project changes, parsing only the changed files.
+    --nbconvert           Convert notebooks with nbconvert instead of the
+                          built-in extractor, in parallel processes unless
+                          the --jobs option is given (requires nbconvert and
+                          ipython).
+    --target-python <version>
+                          Treat the standard library of this Python version,
+                          e.g. 3.12, as built-in (default: the modules of
+                          all Python versions).
+    --jobs <n>            Parse files in <n> parallel processes (0 uses all
+                          available CPUs).
+    --no-cache            Parse every file again instead of reusing the
+                          imports found by previous runs.
+    --cache-dir <dir>     Keep the pipreqs caches in the given directory.
+    --cache-ttl <seconds>
+                          Reuse packages resolved on the PyPI server for
+                          <seconds> before checking for new releases
+                          (default: 86400).
+    --refresh             Check every package cached from the PyPI server
+                          for new releases.
+    --offline             Resolve packages from the PyPI cache only, never
+                          contacting the PyPI server.
+    --index-file <file>   Resolve packages from a package index made with
+                          build-index instead of the PyPI server.
+    --parser <name>       Find imports with the <ast> parser, or with the
+                          faster <tokens> scanner which does not check the
+                          syntax outside of import statements.
+    --profile <file>      Write the wall and CPU time, files and bytes of each
+                          phase of the run, the slowest files and the latency
+                          of the PyPI requests to <file> as JSON.
+    --cprofile <file>     Write the cProfile statistics of the whole run to
+                          <file>.
 """
-from contextlib import contextmanager
+from contextlib import closing, contextmanager, nullcontext
 import os
 import sys
 import re
 import logging
 import ast
+import codecs
+import collections
+import csv
+import functools
+import shutil
+import struct
 import traceback
-from docopt import docopt
-import requests
-from yarg import json2package
-from yarg.exceptions import HTTPError
+import keyword
+import hashlib
+import heapq
+import json
+import tempfile
+import threading
+import time
+from types import MappingProxyType
 
 from pipreqs import __version__
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
 REGEXP = [re.compile(r"^import (.+)$"), re.compile(r"^from ((?!\.+).*?) import (?:.*)$")]
 DEFAULT_EXTENSIONS = [".py", ".pyw"]
+# Parallel parsing: aim for a few batches per worker, and keep each batch
+# small enough that a single slow task cannot hold up the whole run.
+BATCHES_PER_JOB = 4
+MAX_BATCH_FILES = 256
+DEFAULT_PYPI_CONCURRENCY = 8
+# Fields of statements (and of except handlers and match cases) that
+# hold nested statements.
+STATEMENT_FIELDS = ("body", "orelse", "finalbody", "handlers", "cases")
+# Bump PARSE_CACHE_VERSION whenever the format of the parse cache changes.
+PARSE_CACHE_VERSION = 3
+PARSE_CACHE_MAX_ENTRIES = 200000
+PYPI_CACHE_VERSION = 1
+DEFAULT_PYPI_CACHE_TTL = 24 * 60 * 60
+PACKAGE_INDEX_VERSION = 1
+ENVIRONMENT_CACHE_VERSION = 1
+WATCH_INTERVAL = 1.0
+# Python files larger than this many bytes are memory-mapped rather than read.
+MMAP_THRESHOLD = 1 << 20
+PROFILE_SLOWEST_FILES = 10
 
 scan_noteboooks = False
+use_nbconvert = False
 
 
 class NbconvertNotInstalled(ImportError):
@@ -98,78 +192,1433 @@ def _open(filename=None, mode="r"):
             file.close()
 
 
-def get_all_imports(path, encoding="utf-8", extra_ignore_dirs=None, follow_links=True, ignore_errors=False):
-    imports = set()
-    raw_imports = set()
-    candidates = []
-    ignore_dirs = [
-        ".hg",
-        ".svn",
-        ".git",
-        ".tox",
-        "__pycache__",
-        "env",
-        "venv",
-        ".venv",
-        ".ipynb_checkpoints",
-    ]
+def default_cache_dir():
+    """Return the per-user directory where pipreqs keeps its caches."""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "pipreqs")
 
-    if extra_ignore_dirs:
-        ignore_dirs_parsed = []
-        for e in extra_ignore_dirs:
-            ignore_dirs_parsed.append(os.path.basename(os.path.realpath(e)))
-        ignore_dirs.extend(ignore_dirs_parsed)
 
-    extensions = get_file_extensions()
+def _write_json_atomic(file_name, data):
+    """Write *data* as JSON so that readers never see a partial file."""
+    directory = os.path.dirname(file_name)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_name, file_name)
+    except BaseException:
+        try:
+            os.remove(tmp_name)
+        except OSError:
+            pass
+        raise
+
 
-    walk = os.walk(path, followlinks=follow_links)
-    for root, dirs, files in walk:
-        dirs[:] = [d for d in dirs if d not in ignore_dirs]
+def _load_json(file_name, version):
+    """Return the entries of a cache file, or ``{}`` if missing or outdated."""
+    try:
+        with open(file_name, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != version:
+        logging.debug("Discarding cache %s from another pipreqs version", file_name)
+        return {}
+    return data.get("entries", {})
+
+
+def _file_stamp(file_name):
+    # Changes whenever file_name is replaced or modified, None if missing
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
 
-        candidates.append(os.path.basename(root))
-        py_files = [file for file in files if file_ext_is_allowed(file, DEFAULT_EXTENSIONS)]
-        candidates.extend([os.path.splitext(filename)[0] for filename in py_files])
 
-        files = [fn for fn in files if file_ext_is_allowed(fn, extensions)]
+def _file_digest(file_name):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-        for file_name in files:
-            file_name = os.path.join(root, file_name)
 
+class ParseCache:
+    """On-disk cache of the imports found in each scanned file.
+
+    Entries are keyed by the absolute path of the file and validated
+    against its size, modification time and content hash, so only new or
+    changed files need to be parsed again. Each project has its own cache
+    file, so a run only loads the entries of the project it scans, and
+    the file is only written when entries were added or changed. The
+    least recently used entries are evicted once the cache holds more
+    than *max_entries*. Parallel pipreqs runs can share the cache, as
+    updates are merged into the file under a lock.
+
+    The module names of the entries are interned, so that the many files
+    importing the same modules share one copy of each name.
+
+    Args:
+        cache_dir (str): Directory holding the cache files.
+        project (str): The project directory (or file) scanned; by
+            default the entries are kept in a file shared by all scans.
+        max_entries (int): Maximum number of files kept in the cache.
+
+    """
+
+    file_name = "imports.json"
+
+    def __init__(self, cache_dir, project=None, max_entries=PARSE_CACHE_MAX_ENTRIES):
+        file_name = self.file_name
+        if project is not None:
+            digest = hashlib.blake2b(os.fsencode(os.path.realpath(project)), digest_size=8).hexdigest()
+            file_name = "imports-{}.json".format(digest)
+        self.path = os.path.join(cache_dir, file_name)
+        self.max_entries = max_entries
+        # Stamp of the file the entries were loaded from, before loading
+        # them: save() only loads the file again if it changed since.
+        self._stamp = _file_stamp(self.path)
+        self.entries = self._load()
+        # Keys of the entries added or changed, which are written by
+        # save(), and of those only used, whose new time of use is only
+        # written along with them.
+        self.updated = set()
+        self.used = set()
+
+    def _load(self):
+        entries = _load_json(self.path, PARSE_CACHE_VERSION)
+        for entry in entries.values():
+            entry["imports"] = [sys.intern(name) if name else name for name in entry["imports"]]
+            entry["parser"] = sys.intern(entry["parser"])
+        return entries
+
+    def lookup(self, file_name, parser="ast"):
+        """Return the cached imports of *file_name*, or ``None`` if stale."""
+        key = os.path.abspath(file_name)
+        entry = self.entries.get(key)
+        # Only the ast parser checks the syntax of the whole file, so its
+        # results can be reused by either parser but not the other way round.
+        # Notebooks converted by nbconvert (labelled "<parser>+nbconvert")
+        # are kept apart from those read by the built-in extractor.
+        _, plus, conversion = parser.partition("+")
+        if entry is None or entry["parser"] not in (parser, "ast" + plus + conversion):
+            return None
+        try:
+            stat = os.stat(file_name)
+        except OSError:
+            return None
+        if entry["size"] != stat.st_size:
+            return None
+        if entry["mtime"] != stat.st_mtime_ns:
+            # Touched but maybe not modified: fall back to the content hash.
             try:
-                contents = read_file_content(file_name, encoding)
-                tree = ast.parse(contents)
-                for node in ast.walk(tree):
-                    if isinstance(node, ast.Import):
-                        for subnode in node.names:
-                            raw_imports.add(subnode.name)
-                    elif isinstance(node, ast.ImportFrom):
-                        raw_imports.add(node.module)
-            except Exception as exc:
-                if ignore_errors:
-                    traceback.print_exc()
-                    logging.warning("Failed on file: %s" % file_name)
+                if entry["hash"] != _file_digest(file_name):
+                    return None
+            except OSError:
+                return None
+            mtime = self._trusted_mtime(stat)
+            if mtime is not None:
+                entry["mtime"] = mtime
+                self.updated.add(key)
+        entry["used"] = time.time()
+        self.used.add(key)
+        return set(entry["imports"])
+
+    def store(self, file_name, imports, parser="ast"):
+        """Remember the *imports* found in *file_name* by *parser*."""
+        try:
+            stat = os.stat(file_name)
+            digest = _file_digest(file_name)
+        except OSError:
+            return
+        key = os.path.abspath(file_name)
+        self.entries[key] = {
+            "size": stat.st_size,
+            "mtime": self._trusted_mtime(stat),
+            "hash": digest,
+            "imports": sorted((sys.intern(name) if name else name for name in imports), key=lambda name: name or ""),
+            "parser": parser,
+            "used": time.time(),
+        }
+        self.updated.add(key)
+
+    @staticmethod
+    def _trusted_mtime(stat):
+        # A file modified in the last couple of seconds may be modified
+        # again without its (coarse) mtime changing, so only trust its
+        # hash next time.
+        if time.time() - stat.st_mtime < 2:
+            return None
+        return stat.st_mtime_ns
+
+    def save(self):
+        """Merge the updated entries into the cache file, evicting the oldest entries.
+
+        Nothing is written if no entry was added or changed, such as when
+        every lookup hit the cache.
+
+        """
+        if not self.updated:
+            return
+        try:
+            with _file_lock(self.path + ".lock"):
+                if _file_stamp(self.path) == self._stamp:
+                    # Nobody else saved the cache: our entries are up to date
+                    entries = self.entries
+                else:
+                    entries = self._load()
+                    entries.update((key, self.entries[key]) for key in self.updated)
+                    for key in self.used & entries.keys():
+                        entries[key]["used"] = max(entries[key]["used"], self.entries[key]["used"])
+                if len(entries) > self.max_entries:
+                    recent = sorted(entries.items(), key=lambda item: item[1]["used"], reverse=True)
+                    entries = dict(recent[: self.max_entries])
+                _write_json_atomic(self.path, {"version": PARSE_CACHE_VERSION, "entries": entries})
+                self._stamp = _file_stamp(self.path)
+            self.entries = entries
+        except OSError as error:
+            logging.warning("Could not save the parse cache to %s: %s", self.path, error)
+        self.updated = set()
+        self.used = set()
+
+
+@contextmanager
+def _file_lock(file_name):
+    """Hold an exclusive lock on *file_name*, shared between processes."""
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    with open(file_name, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:  # pragma: no cover
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:  # pragma: no cover
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class PyPICache:
+    """On-disk cache of the packages resolved on PyPI servers.
+
+    Entries are keyed by the requested URL and hold the resolved name and
+    latest version, or mark the package as missing. Entries older than
+    *ttl* seconds are stale: they are revalidated with their ETag, so an
+    unchanged package costs a ``304 Not Modified`` instead of the whole
+    document. Parallel pipreqs runs can share the cache, as updates are
+    merged into the file under a lock.
+
+    Args:
+        cache_dir (str): Directory holding the cache file.
+        ttl (int): Number of seconds during which entries are fresh.
+
+    """
+
+    file_name = "pypi.json"
+
+    def __init__(self, cache_dir, ttl=DEFAULT_PYPI_CACHE_TTL):
+        self.path = os.path.join(cache_dir, self.file_name)
+        self.ttl = ttl
+        self.entries = self._load()
+        self.updates = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        return _load_json(self.path, PYPI_CACHE_VERSION)
+
+    def get(self, url):
+        """Return the entry of *url*, or ``None``."""
+        with self._lock:
+            return self.entries.get(url)
+
+    def is_fresh(self, entry):
+        return time.time() - entry["fetched"] < self.ttl
+
+    def put(self, url, name=None, version=None, etag=None):
+        """Remember the package found at *url*; without a name it is missing."""
+        entry = {"name": name, "version": version, "etag": etag, "fetched": time.time()}
+        with self._lock:
+            self.entries[url] = self.updates[url] = entry
+
+    def touch(self, url):
+        """Mark the entry of *url* as revalidated."""
+        with self._lock:
+            entry = dict(self.entries[url], fetched=time.time())
+            self.entries[url] = self.updates[url] = entry
+
+    def save(self):
+        """Merge the new entries into the cache file."""
+        if not self.updates:
+            return
+        try:
+            with _file_lock(self.path + ".lock"):
+                entries = self._load()
+                entries.update(self.updates)
+                _write_json_atomic(self.path, {"version": PYPI_CACHE_VERSION, "entries": entries})
+        except OSError as error:
+            logging.warning("Could not save the PyPI cache to %s: %s", self.path, error)
+        self.updates = {}
+
+
+class Profile:
+    """Metrics of each phase of a run, reported by --profile.
+
+    The time spent in a phase excludes the phases nested in it, so that
+    the files yielded by the walk are not also counted as parse time. The
+    CPU time is that of the whole process. Workers of a process pool
+    profile their batches on their own, and their metrics are merged by
+    :meth:`merge`: their phases then add up the time of every worker.
+
+    Args:
+        slowest (int): Number of slowest files to report.
+
+    """
+
+    def __init__(self, slowest=PROFILE_SLOWEST_FILES):
+        self.slowest = slowest
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._phases = {}
+        self._files = []
+        self._latencies = []
+        self._statuses = collections.Counter()
+        self._start = (time.perf_counter(), time.process_time())
+
+    def __getstate__(self):
+        # Sent to the workers of a process pool, which start afresh
+        return {"slowest": self.slowest}
+
+    def __setstate__(self, state):
+        self.__init__(state["slowest"])
+
+    @contextmanager
+    def phase(self, name):
+        """Add the time spent in the ``with`` block to the phase *name*."""
+        stack = self._local.__dict__.setdefault("stack", [])
+        # Time spent in the nested phases
+        stack.append([0.0, 0.0])
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+            nested_wall, nested_cpu = stack.pop()
+            if stack:
+                stack[-1][0] += wall
+                stack[-1][1] += cpu
+            self._add(name, wall - nested_wall, cpu - nested_cpu, calls=1)
+
+    def iterate(self, name, iterable):
+        """Generate the items of *iterable*, counting each as a file of the phase *name*."""
+        iterator = iter(iterable)
+        try:
+            while True:
+                with self.phase(name):
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                self._add(name, files=1)
+                yield item
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    def file(self, name, file_name, size, seconds):
+        """Count a file of *size* bytes, read and parsed in *seconds*, in the phase *name*."""
+        self._add(name, files=1, bytes=size)
+        with self._lock:
+            self._add_slow_file(seconds, file_name, size)
+
+    def request(self, seconds, status):
+        """Count an HTTP request answered in *seconds* with *status* (``None`` if it failed)."""
+        with self._lock:
+            self._latencies.append(seconds)
+            self._statuses["error" if status is None else str(status)] += 1
+
+    def snapshot(self):
+        """Return the metrics recorded so far, to be merged into another profile."""
+        with self._lock:
+            return {
+                "phases": {name: dict(phase) for name, phase in self._phases.items()},
+                "files": list(self._files),
+                "latencies": list(self._latencies),
+                "statuses": dict(self._statuses),
+            }
+
+    def merge(self, snapshot):
+        """Add the metrics of a :meth:`snapshot`, e.g. from a worker process."""
+        for name, phase in snapshot["phases"].items():
+            self._add(name, **phase)
+        with self._lock:
+            for entry in snapshot["files"]:
+                self._add_slow_file(*entry)
+            self._latencies.extend(snapshot["latencies"])
+            self._statuses.update(snapshot["statuses"])
+
+    def report(self):
+        """Return the metrics as a JSON serialisable dict."""
+        with self._lock:
+            phases = {
+                name: dict(phase, wall_time=round(phase["wall_time"], 6), cpu_time=round(phase["cpu_time"], 6))
+                for name, phase in sorted(self._phases.items())
+            }
+            slowest = [
+                {"file": file_name, "seconds": round(seconds, 6), "bytes": size}
+                for seconds, file_name, size in sorted(self._files, reverse=True)
+            ]
+            latencies = sorted(self._latencies)
+            statuses = dict(self._statuses)
+
+        http = {"requests": len(latencies), "statuses": statuses}
+        if latencies:
+            http["latency"] = {
+                "mean": round(sum(latencies) / len(latencies), 6),
+                "p50": round(_percentile(latencies, 50), 6),
+                "p90": round(_percentile(latencies, 90), 6),
+                "p99": round(_percentile(latencies, 99), 6),
+                "max": round(latencies[-1], 6),
+            }
+        return {
+            "version": __version__,
+            "wall_time": round(time.perf_counter() - self._start[0], 6),
+            "cpu_time": round(time.process_time() - self._start[1], 6),
+            "phases": phases,
+            "slowest_files": slowest,
+            "http": http,
+        }
+
+    def save(self, file_name):
+        """Write the :meth:`report` to *file_name* as JSON."""
+        with open(file_name, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+            f.write("\n")
+
+    def _add(self, name, wall_time=0.0, cpu_time=0.0, calls=0, files=0, bytes=0):
+        with self._lock:
+            phase = self._phases.get(name)
+            if phase is None:
+                phase = self._phases[name] = {"wall_time": 0.0, "cpu_time": 0.0, "calls": 0, "files": 0, "bytes": 0}
+            phase["wall_time"] += wall_time
+            phase["cpu_time"] += cpu_time
+            phase["calls"] += calls
+            phase["files"] += files
+            phase["bytes"] += bytes
+
+    def _add_slow_file(self, seconds, file_name, size):
+        entry = (seconds, file_name, size)
+        if len(self._files) < self.slowest:
+            heapq.heappush(self._files, entry)
+        elif self._files and entry > self._files[0]:
+            heapq.heapreplace(self._files, entry)
+
+
+def _percentile(ordered, percent):
+    # Nearest rank percentile of a sorted list
+    return ordered[min(len(ordered) - 1, max(0, -(-len(ordered) * percent // 100) - 1))]
+
+
+def _profile_phase(profile, name):
+    # profile.phase(name), or nothing when not profiling
+    return profile.phase(name) if profile is not None else nullcontext()
+
+
+# Files marking the root directory of a project, see --projects.
+PROJECT_MARKERS = frozenset(["pyproject.toml", "setup.py", "requirements.txt"])
+IGNORE_DIRS = (
+    ".hg",
+    ".svn",
+    ".git",
+    ".tox",
+    "__pycache__",
+    "env",
+    "venv",
+    ".venv",
+    ".ipynb_checkpoints",
+)
+
+
+class IgnorePatterns:
+    """Gitignore-style patterns, compiled into one regular expression.
+
+    Patterns without a slash match a file or directory name at any depth,
+    other patterns match paths relative to the project directory. ``*``
+    and ``?`` do not match slashes, ``**`` matches any number of
+    directories, a trailing slash only matches directories and a leading
+    ``!`` includes again what earlier patterns ignore.
+
+    Args:
+        patterns (Iterable[str]): The patterns, as the lines of a
+            ``.gitignore`` file; blank lines and comments are skipped.
+
+    """
+
+    def __init__(self, patterns):
+        file_patterns, dir_patterns = [], []
+        self.negated = set()
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith("#"):
+                continue
+            group = "p%d" % len(dir_patterns)
+            if pattern.startswith("!"):
+                self.negated.add(group)
+                pattern = pattern[1:]
+            elif pattern.startswith("\\"):
+                pattern = pattern[1:]
+            dir_only = pattern.endswith("/")
+            regex = "(?P<%s>%s)" % (group, _translate_ignore_pattern(pattern.rstrip("/")))
+            dir_patterns.append(regex)
+            if not dir_only:
+                file_patterns.append(regex)
+        # The last matching pattern decides, so try them from the last
+        self.files = re.compile("|".join(reversed(file_patterns)) or "(?!)")
+        self.dirs = re.compile("|".join(reversed(dir_patterns)) or "(?!)")
+
+    def match(self, path, is_dir=False):
+        """Return whether *path*, relative to the project and separated by slashes, is ignored."""
+        match = (self.dirs if is_dir else self.files).fullmatch(path)
+        return match is not None and match.lastgroup not in self.negated
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_ignore_patterns(patterns):
+    return IgnorePatterns(patterns)
+
+
+def _translate_ignore_pattern(pattern):
+    anchored = "/" in pattern
+    if pattern.startswith("/"):
+        pattern = pattern[1:]
+    parts = []
+    i, n = 0, len(pattern)
+    while i < n:
+        char = pattern[i]
+        if pattern.startswith("**/", i) and (i == 0 or pattern[i - 1] == "/"):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i) and (i == 0 or pattern[i - 1] == "/") and i + 2 == n:
+            parts.append(".*")
+            i += 2
+        elif char == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif char == "?":
+            parts.append("[^/]")
+            i += 1
+        elif char == "[" and pattern.find("]", i + 2) != -1:
+            end = pattern.find("]", i + 2)
+            chars = pattern[i + 1:end]
+            if chars.startswith("!"):
+                chars = "^" + chars[1:]
+            parts.append("[%s]" % chars.replace("\\", "\\\\"))
+            i = end + 1
+        elif char == "\\" and i + 1 < n:
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(char))
+            i += 1
+    return ("" if anchored else "(?:.*/)?") + "".join(parts)
+
+
+class Scanner:
+    """Find the imports of projects, all scanned with one configuration.
+
+    The configuration and the tables it needs are set up once, and no
+    module level state is used, so one scanner can be shared by any
+    number of threads scanning different projects at the same time.
+
+    Args:
+        encoding (str): Encoding of the notebooks, and of the python files
+            that are not valid in the encoding they declare (UTF-8 by
+            default).
+        extra_ignore_dirs (List[str]): More files and directories to skip,
+            as :class:`IgnorePatterns`. They are completed by the patterns
+            of the ``.pipreqsignore`` file of each project.
+        follow_links (bool): Walk into symbolic links to directories.
+        ignore_errors (bool): Log and skip files that cannot be parsed
+            instead of raising.
+        scan_notebooks (bool): Also scan jupyter notebooks.
+        nbconvert (bool): Convert notebooks with nbconvert instead of the
+            built-in extractor.
+        jobs (int): Parse files in this many processes, ``0`` for all
+            available CPUs. By default the files are parsed in the
+            calling thread, except notebooks converted by nbconvert.
+            The paths of all the files are held in memory to batch them.
+        cache_dir (str): Reuse and update the parse cache in this
+            directory. Its entries, one per file, are held in memory.
+        parser (str): How to find the import statements, see
+            :func:`imports_from_source`.
+        target_python (str): Treat the standard library of this Python
+            version as built-in, see :func:`get_stdlib_modules`.
+        use_git (bool): Only scan the files listed by git, tracked or
+            untracked but not ignored, instead of walking the whole
+            directory. Outside of git repositories the directory is
+            walked.
+        profile (Profile): Record the metrics of the walk and of each
+            file parsed.
+
+    """
+
+    def __init__(
+        self,
+        encoding="utf-8",
+        extra_ignore_dirs=None,
+        follow_links=True,
+        ignore_errors=False,
+        scan_notebooks=False,
+        nbconvert=False,
+        jobs=None,
+        cache_dir=None,
+        parser="ast",
+        target_python=None,
+        use_git=False,
+        profile=None,
+    ):
+        if parser not in ["ast", "tokens"]:
+            raise ValueError("Invalid argument for parser flag, use 'ast' or 'tokens' instead")
+        self.scan_notebooks = bool(scan_notebooks)
+        self.nbconvert = self.scan_notebooks and bool(nbconvert)
+        if self.nbconvert:
+            try:
+                import nbconvert  # noqa: F401
+            except ImportError:
+                raise NbconvertNotInstalled()
+
+        self.encoding = encoding
+        self.ignore_dirs = frozenset(IGNORE_DIRS)
+        self.ignore_patterns = tuple(extra_ignore_dirs or ())
+        self.follow_links = follow_links
+        self.ignore_errors = ignore_errors
+        self.extensions = frozenset(DEFAULT_EXTENSIONS + [".ipynb"] if self.scan_notebooks else DEFAULT_EXTENSIONS)
+        self.jobs = (os.cpu_count() or 1) if jobs == 0 else jobs
+        self.cache_dir = cache_dir
+        self.parser = parser
+        self.stdlib = get_stdlib_modules(target_python)
+        self.use_git = use_git
+        self.profile = profile
+
+    def get_all_imports(self, path):
+        """Return the packages imported by the project at *path*.
+
+        Imports of the project's own modules and of the standard library
+        are left out.
+
+        The imports of each file are reduced to their top level names as
+        soon as it is parsed, so without a parse cache and parsed in this
+        process the memory used grows with the number of distinct names,
+        not of files. The parse cache holds an entry per file, and
+        parallel parsing (*jobs*) lists every file to batch them, so both
+        still use memory in proportion to the number of files.
+
+        """
+        imports = set()
+        local_names = set()
+        # Reduce each import to its top level name as it is generated, so
+        # that memory grows with the number of distinct names rather than
+        # of files.
+        for _, name in self.iter_imports(path, local_names):
+            imports.add(sys.intern(name.partition(".")[0]))
+
+        packages = imports - (local_names & imports)
+        logging.debug("Found packages: {0}".format(packages))
+
+        return list(packages - self.stdlib)
+
+    def iter_imports(self, path, local_names=None):
+        """Generate the imports of the files under *path* as they are parsed.
+
+        Files are parsed in the order of the walk, or as their batches
+        complete when they are parsed in parallel. The caller may stop at
+        any time; the imports parsed so far are still saved to the cache.
+
+        Args:
+            path (str): The project directory (or a single file).
+            local_names (set): If given, the names of the directories and
+                python modules of the project are added to it as they are
+                walked. Imports of these names are local rather than
+                packages.
+
+        Yields:
+            Tuple[str, str]: The path of a file and a module it imports,
+                as written in the import statement (e.g. ``os.path``).
+                Relative imports (``from . import X``) are left out.
+
+        """
+        parsed = self._parse_files(self.walk(path, local_names), path)
+        try:
+            for file_name, raw_imports in parsed:
+                for name in sorted(name for name in raw_imports if name):
+                    yield file_name, name
+        finally:
+            parsed.close()
+
+    def get_project_imports(self, path):
+        """Return the packages imported by each project under *path*.
+
+        Projects are the directories holding one of the
+        :data:`PROJECT_MARKERS` files. Each file belongs to the innermost
+        project holding it, and files outside of any project are left
+        out. The whole tree is walked and parsed once.
+
+        Returns:
+            Dict[str, List[str]]: The imports of each project directory,
+                as returned by :meth:`get_all_imports`.
+
+        """
+        path = os.path.normpath(path)
+        projects, directories = set(), set()
+        owners = {}
+
+        def owner(directory):
+            # The innermost project holding directory, or None
+            if directory not in owners:
+                if directory in projects:
+                    owners[directory] = directory
+                elif directory == path or os.path.dirname(directory) == directory:
+                    owners[directory] = None
+                else:
+                    owners[directory] = owner(os.path.dirname(directory))
+            return owners[directory]
+
+        imports = collections.defaultdict(set)
+        local_names = collections.defaultdict(set)
+
+        def project_files():
+            # The walk is top-down, so the projects holding a file are known
+            # by the time it is yielded.
+            for file_name in self.walk(path, directories=directories, projects=projects):
+                project = owner(os.path.dirname(file_name))
+                if project:
+                    if file_ext_is_allowed(file_name, DEFAULT_EXTENSIONS):
+                        local_names[project].add(os.path.splitext(os.path.basename(file_name))[0])
+                    yield file_name
+
+        for file_name, raw_imports in self._parse_files(project_files(), path):
+            imports[owner(os.path.dirname(file_name))].update(_top_level_names(raw_imports))
+        for directory in directories:
+            project = owner(directory)
+            if project:
+                local_names[project].add(os.path.basename(directory))
+
+        return {
+            project: sorted(imports[project] - local_names[project] - self.stdlib) for project in projects
+        }
+
+    def _parse_files(self, file_names, project=None):
+        # The raw imports of each file, from the cache of the project or
+        # parsed by the configured pool
+        cache = None
+        if self.cache_dir:
+            with _profile_phase(self.profile, "parse_cache"):
+                cache = ParseCache(self.cache_dir, project)
+        if self.jobs and self.jobs > 1:
+            parsed = self._iter_parse_pending(file_names, self._iter_parse_parallel, cache)
+        elif self.jobs is None and self.nbconvert:
+            parsed = self._iter_parse_pending(file_names, self._iter_parse_notebook_pool, cache)
+        else:
+            parsed = self._iter_parse(file_names, cache)
+        try:
+            yield from parsed
+        finally:
+            parsed.close()
+            if cache:
+                with _profile_phase(self.profile, "parse_cache"):
+                    cache.save()
+
+    def walk(self, path, local_names=None, directories=None, projects=None):
+        """Generate the files to scan under *path*.
+
+        Args:
+            path (str): The project directory, or a single file which is
+                generated if it has one of the scanned extensions.
+            local_names (set): See :meth:`iter_imports`.
+            directories (set): If given, the directories walked are added
+                to it.
+            projects (set): If given, the directories holding one of the
+                :data:`PROJECT_MARKERS` files are added to it.
+
+        """
+        walk = self._walk(path, local_names, directories, projects)
+        return self.profile.iterate("walk", walk) if self.profile else walk
+
+    def _walk(self, path, local_names, directories, projects):
+        if os.path.isfile(path):
+            if os.path.splitext(path)[1] in self.extensions:
+                if local_names is not None and file_ext_is_allowed(path, DEFAULT_EXTENSIONS):
+                    local_names.add(os.path.splitext(os.path.basename(path))[0])
+                yield path
+            return
+        ignore = self.ignore_matcher(path)
+        walk = self._git_walk(path) if self.use_git else None
+        if walk is None:
+            walk = os.walk(path, followlinks=self.follow_links)
+        for root, dirs, files in walk:
+            dirs[:] = [d for d in dirs if d not in self.ignore_dirs]
+            if ignore is not None:
+                # Prune the ignored directories before they are entered
+                prefix = os.path.relpath(root, path).replace(os.sep, "/") + "/"
+                if prefix == "./":
+                    prefix = ""
+                dirs[:] = [d for d in dirs if not ignore.match(prefix + d, is_dir=True)]
+                files = [f for f in files if not ignore.match(prefix + f)]
+            if directories is not None:
+                directories.add(root)
+            if projects is not None and not PROJECT_MARKERS.isdisjoint(files):
+                projects.add(root)
+
+            if local_names is not None:
+                local_names.add(os.path.basename(root))
+                py_files = [file for file in files if file_ext_is_allowed(file, DEFAULT_EXTENSIONS)]
+                local_names.update(os.path.splitext(filename)[0] for filename in py_files)
+
+            for file_name in files:
+                if os.path.splitext(file_name)[1] in self.extensions:
+                    yield os.path.join(root, file_name)
+
+    def ignore_matcher(self, path):
+        """Return the :class:`IgnorePatterns` of the project at *path*, or ``None``."""
+        patterns = []
+        for pattern in self.ignore_patterns:
+            if os.path.isabs(pattern) or _is_cwd_path(pattern, path):
+                # A path in the project, or any directory of that name
+                relative = os.path.relpath(os.path.realpath(pattern), os.path.realpath(path))
+                if relative == os.curdir:
                     continue
+                if relative.startswith(os.pardir):
+                    pattern = os.path.basename(pattern.rstrip(os.sep).rstrip("/"))
                 else:
-                    logging.error("Failed on file: %s" % file_name)
-                    raise exc
-
-    # Clean up imports
-    for name in [n for n in raw_imports if n]:
-        # Sanity check: Name could have been None if the import
-        # statement was as ``from . import X``
-        # Cleanup: We only want to first part of the import.
-        # Ex: from django.conf --> django.conf. But we only want django
-        # as an import.
-        cleaned_name, _, _ = name.partition(".")
-        imports.add(cleaned_name)
-
-    packages = imports - (set(candidates) & imports)
-    logging.debug("Found packages: {0}".format(packages))
+                    pattern = "/" + relative.replace(os.sep, "/")
+            elif pattern.startswith("./"):
+                pattern = pattern[1:]
+            patterns.append(pattern)
+        try:
+            with open(os.path.join(path, ".pipreqsignore"), "r", encoding="utf-8") as f:
+                patterns.extend(f.read().splitlines())
+        except OSError:
+            pass
+        return _compile_ignore_patterns(tuple(patterns)) if patterns else None
+
+    def _git_walk(self, path):
+        # Like os.walk, but over the files listed by git: tracked files
+        # and untracked files that are not ignored. None if git cannot
+        # list the files of path.
+        import subprocess
 
-    with open(join("stdlib"), "r") as f:
-        data = {x.strip() for x in f}
+        try:
+            output = subprocess.run(
+                ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+                cwd=path,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                check=True,
+            ).stdout
+        except (OSError, subprocess.CalledProcessError):
+            logging.debug("Could not list the files of %s with git, walking it instead", path)
+            return None
+
+        tree = {"": ([], [])}
+        for name in os.fsdecode(output).split("\0"):
+            if not name:
+                continue
+            directory, _, file_name = name.rpartition("/")
+            if os.path.splitext(file_name)[1] in self.extensions and not os.path.isfile(os.path.join(path, name)):
+                # Deleted, but the deletion is not staged yet
+                continue
+            _git_tree_node(tree, directory)[1].append(file_name)
+
+        def walk(directory):
+            dirs, files = tree[directory]
+            yield (os.path.join(path, *directory.split("/")) if directory else path), dirs, files
+            for d in dirs:
+                yield from walk(directory + "/" + d if directory else d)
+
+        return walk("")
+
+    def read(self, file_name):
+        """Return the python source of *file_name*."""
+        if file_ext_is_allowed(file_name, [".ipynb"]):
+            if self.nbconvert:
+                return ipynb_2_py(file_name, encoding=self.encoding)
+            return notebook_to_python(file_name, encoding=self.encoding)
+        with open(file_name, "r", encoding=self.encoding) as f:
+            return f.read()
+
+    @contextmanager
+    def source(self, file_name):
+        """Open the python source of *file_name*, to be parsed in the ``with`` block.
+
+        Python files are left undecoded, for the parser to honour their
+        BOM or coding cookie (PEP 263), and files larger than
+        :data:`MMAP_THRESHOLD` bytes are memory-mapped rather than read.
+        Notebooks are converted to python source, as by :meth:`read`.
+
+        Yields:
+            str, bytes or mmap.mmap: The source.
+
+        """
+        if file_ext_is_allowed(file_name, [".ipynb"]):
+            yield self.read(file_name)
+            return
+        with open(file_name, "rb") as f:
+            if os.fstat(f.fileno()).st_size <= MMAP_THRESHOLD:
+                yield f.read()
+                return
+            import mmap
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as contents:
+                yield contents
+
+    def _imports_of(self, file_name):
+        with self.source(file_name) as contents:
+            return self._imports_from_source(file_name, contents)
+
+    def _imports_from_source(self, file_name, contents):
+        try:
+            return imports_from_source(contents, self.parser)
+        except SyntaxError as exc:
+            if isinstance(contents, str) or not _is_decoding_error(exc):
+                raise
+        # Not valid in the encoding it declares (UTF-8 by default): decode
+        # it with --encoding instead, as only the import statements matter.
+        logging.debug("Decoding %s with %s", file_name, self.encoding)
+        return imports_from_source(contents[:].decode(self.encoding, errors="replace"), self.parser)
+
+    def parse_imports(self, file_names):
+        """Collect the raw module names imported by the given files.
+
+        Args:
+            file_names (List[str]): Paths of the files to parse.
+
+        Returns:
+            Dict[str, Set[str]]: The dotted module names as written in the
+                import statements of each file (``None`` for
+                ``from . import X``). Files that failed are left out.
+
+        """
+        return dict(self._iter_parse(file_names))
+
+    def _parser_label(self, file_name):
+        # Notebooks converted by nbconvert are cached apart from those read
+        # by the built-in extractor.
+        if self.nbconvert and file_ext_is_allowed(file_name, [".ipynb"]):
+            return self.parser + "+nbconvert"
+        return self.parser
+
+    def _iter_parse(self, file_names, cache=None):
+        for file_name in file_names:
+            label = self._parser_label(file_name)
+            raw_imports = None
+            if cache:
+                with _profile_phase(self.profile, "parse_cache"):
+                    raw_imports = cache.lookup(file_name, label)
+            if raw_imports is None:
+                try:
+                    raw_imports = self._parse_file(file_name)
+                except Exception as exc:
+                    if self.ignore_errors:
+                        traceback.print_exc()
+                        logging.warning("Failed on file: %s" % file_name)
+                        continue
+                    else:
+                        logging.error("Failed on file: %s" % file_name)
+                        raise exc
+                if cache:
+                    cache.store(file_name, raw_imports, label)
+            yield file_name, raw_imports
+
+    def _parse_file(self, file_name):
+        if self.profile is None:
+            return self._imports_of(file_name)
+        start = time.perf_counter()
+        phase = "notebooks" if file_ext_is_allowed(file_name, [".ipynb"]) else "read"
+        with self.profile.phase(phase), self.source(file_name) as contents:
+            with self.profile.phase("parse"):
+                raw_imports = self._imports_from_source(file_name, contents)
+        self.profile.file(phase, file_name, os.path.getsize(file_name), time.perf_counter() - start)
+        return raw_imports
+
+    def _parse_batch(self, file_names):
+        # Run by the workers of a process pool: the imports of each file,
+        # and the profile of the worker to merge into ours
+        return self.parse_imports(file_names), self.profile and self.profile.snapshot()
+
+    def _batch_results(self, future):
+        results, snapshot = future.result()
+        if snapshot:
+            self.profile.merge(snapshot)
+        return results.items()
+
+    def _iter_parse_pending(self, file_names, pool, cache):
+        # Answer what we can from the cache, and send the rest to the pool
+        pending = []
+        hits = 0
+        for file_name in file_names:
+            cached = None
+            if cache:
+                with _profile_phase(self.profile, "parse_cache"):
+                    cached = cache.lookup(file_name, self._parser_label(file_name))
+            if cached is None:
+                pending.append(file_name)
+            else:
+                hits += 1
+                yield file_name, cached
+        if cache:
+            logging.debug("Parse cache: %d hits, %d misses", hits, len(pending))
+
+        parsed = pool(pending)
+        if self.profile:
+            # The time spent waiting for the workers
+            parsed = self.profile.iterate("pool", parsed)
+        try:
+            for file_name, raw_imports in parsed:
+                if cache:
+                    cache.store(file_name, raw_imports, self._parser_label(file_name))
+                yield file_name, raw_imports
+        finally:
+            parsed.close()
+
+    def _iter_parse_parallel(self, file_names):
+        batches = _make_batches(file_names, self.jobs)
+        if len(batches) <= 1:
+            yield from self._iter_parse(file_names)
+            return
+
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        executor = ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker, initargs=(self.nbconvert,))
+        try:
+            futures = [executor.submit(self._parse_batch, batch) for batch in batches]
+            for future in as_completed(futures):
+                yield from self._batch_results(future)
+        finally:
+            # Do not start the remaining batches if the caller stopped early
+            executor.shutdown(cancel_futures=True)
+
+    def _iter_parse_notebook_pool(self, file_names, jobs=None):
+        notebooks = [file_name for file_name in file_names if file_ext_is_allowed(file_name, [".ipynb"])]
+        jobs = jobs or os.cpu_count() or 1
+        if len(notebooks) < 2 or jobs < 2:
+            yield from self._iter_parse(file_names)
+            return
+
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        others = [file_name for file_name in file_names if not file_ext_is_allowed(file_name, [".ipynb"])]
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(True,))
+        try:
+            futures = [executor.submit(self._parse_batch, batch) for batch in _make_batches(notebooks, jobs)]
+            yield from self._iter_parse(others)
+            for future in as_completed(futures):
+                yield from self._batch_results(future)
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+
+def _is_cwd_path(pattern, path):
+    # Whether an --ignore pattern is a path relative to the working
+    # directory (e.g. "proj/tests" for the project "proj"), rather than
+    # to the project.
+    if not any(sep in pattern for sep in ("/", os.sep)) or any(char in pattern for char in "*?[!"):
+        return False
+    relative = pattern[2:] if pattern.startswith("./") else pattern
+    return os.path.exists(pattern) and not os.path.exists(os.path.join(path, relative))
+
+
+def _git_tree_node(tree, directory):
+    # The ([subdirectories], [files]) of directory, added to its parents
+    # if missing.
+    node = tree.get(directory)
+    if node is None:
+        node = tree[directory] = ([], [])
+        parent, _, name = directory.rpartition("/")
+        _git_tree_node(tree, parent)[0].append(name)
+    return node
+
+
+def _scanner(encoding="utf-8", ignore_errors=False, parser="ast", **kwargs):
+    # The scanner of the module level functions, configured by the
+    # --scan-notebooks globals
+    return Scanner(
+        encoding=encoding,
+        ignore_errors=ignore_errors,
+        parser=parser,
+        scan_notebooks=scan_noteboooks,
+        nbconvert=use_nbconvert,
+        **kwargs
+    )
+
+
+def get_all_imports(
+    path,
+    encoding="utf-8",
+    extra_ignore_dirs=None,
+    follow_links=True,
+    ignore_errors=False,
+    jobs=None,
+    cache_dir=None,
+    parser="ast",
+    target_python=None,
+    use_git=False,
+):
+    scanner = _scanner(
+        encoding,
+        ignore_errors,
+        parser,
+        extra_ignore_dirs=extra_ignore_dirs,
+        follow_links=follow_links,
+        jobs=jobs,
+        cache_dir=cache_dir,
+        target_python=target_python,
+        use_git=use_git,
+    )
+    return scanner.get_all_imports(path)
+
+
+def iter_imports(
+    path,
+    encoding="utf-8",
+    extra_ignore_dirs=None,
+    follow_links=True,
+    ignore_errors=False,
+    jobs=None,
+    cache_dir=None,
+    parser="ast",
+    local_names=None,
+    use_git=False,
+):
+    """Generate the imports of the files under *path* as they are parsed.
+
+    See :meth:`Scanner.iter_imports`, for a scanner configured with the
+    given arguments.
+
+    """
+    scanner = _scanner(
+        encoding,
+        ignore_errors,
+        parser,
+        extra_ignore_dirs=extra_ignore_dirs,
+        follow_links=follow_links,
+        jobs=jobs,
+        cache_dir=cache_dir,
+        use_git=use_git,
+    )
+    return scanner.iter_imports(path, local_names)
+
+
+def parse_imports(file_names, encoding="utf-8", ignore_errors=False, parser="ast"):
+    """Collect the raw module names imported by the given files.
+
+    See :meth:`Scanner.parse_imports`.
+
+    """
+    return _scanner(encoding, ignore_errors, parser).parse_imports(file_names)
+
+
+def parse_imports_parallel(file_names, jobs, encoding="utf-8", ignore_errors=False, parser="ast"):
+    """Like :func:`parse_imports`, but spread the work over *jobs* processes.
 
-    return list(packages - data)
+    Files are grouped into batches of roughly equal size, largest files
+    first, so that each worker receives few but evenly loaded tasks.
+
+    """
+    return dict(_scanner(encoding, ignore_errors, parser, jobs=jobs)._iter_parse_parallel(file_names))
+
+
+def parse_imports_notebook_pool(file_names, encoding="utf-8", ignore_errors=False, parser="ast", jobs=None):
+    """Like :func:`parse_imports`, but convert notebooks in worker processes.
+
+    Converting a notebook with nbconvert costs much more than parsing a
+    python file, so the notebooks are sent to a pool of *jobs* processes
+    (all available CPUs by default) while the other files are parsed in
+    this one.
+
+    """
+    return dict(_scanner(encoding, ignore_errors, parser)._iter_parse_notebook_pool(file_names, jobs))
+
+
+def imports_from_source(contents, parser="ast"):
+    """Return the raw module names imported by a piece of Python source.
+
+    Args:
+        contents (str or bytes): The source code.
+        parser (str): ``"ast"`` parses the whole module, which also
+            validates its syntax. ``"tokens"`` only lexes the source to
+            find the import statements, and falls back to ``"ast"`` for
+            sources where it cannot tell them apart with certainty.
+
+    Returns:
+        Set[str]: The dotted module names as written in the import
+            statements (``None`` for ``from . import X``).
+
+    """
+    if parser == "tokens":
+        raw_imports = _scan_import_tokens(contents)
+        if raw_imports is not None:
+            return raw_imports
+    elif parser != "ast":
+        raise ValueError("Invalid parser: {}".format(parser))
+
+    return collect_imports(ast.parse(contents))
+
+
+def _top_level_names(raw_imports):
+    # Cleanup: We only want to first part of the import.
+    # Ex: from django.conf --> django.conf. But we only want django
+    # as an import. The names are interned, as the same few are imported
+    # by many files.
+    return {sys.intern(name.partition(".")[0]) for name in raw_imports if name}
+
+
+def collect_imports(tree):
+    """Return the raw module names imported in a syntax tree.
+
+    Import statements can only appear in statement position, so unlike
+    :func:`ast.walk` this only visits the bodies of statements and never
+    descends into expressions.
+
+    Args:
+        tree (ast.AST): A module, as returned by :func:`ast.parse`.
+
+    Returns:
+        Set[str]: The dotted module names as written in the import
+            statements (``None`` for ``from . import X``).
+
+    """
+    raw_imports = set()
+    nodes = [tree]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, ast.Import):
+            for subnode in node.names:
+                raw_imports.add(subnode.name)
+        elif isinstance(node, ast.ImportFrom):
+            raw_imports.add(node.module)
+        else:
+            for field in STATEMENT_FIELDS:
+                nodes.extend(getattr(node, field, ()))
+    return raw_imports
+
+
+class _TokenPatterns:
+    """The regular expressions of the token scanner, for str or bytes sources."""
+
+    ws = r"(?:[ \t\f]|\\\r?\n)"
+    name = r"[^\W\d]\w*"
+    token = (
+        r"(?P<comment>\#[^\r\n]*)"
+        r"|(?P<string>(?P<prefix>[rRbBuUfF]{{0,2}})"
+        r"(?:'''(?:[^'\\]|\\[\s\S]|'(?!''))*'''"
+        r'|"""(?:[^"\\]|\\[\s\S]|"(?!""))*"""'
+        r"|'(?:[^'\\\r\n]|\\[\s\S])*'"
+        r'|"(?:[^"\\\r\n]|\\[\s\S])*"))'
+        r"|(?P<quote>['\"])"
+        r"|\b(?P<keyword>import|from)\b"
+    )
+    from_ = r"from{ws}*(?:\.{ws}*)*(?P<module>{name}(?:{ws}*\.{ws}*{name})*)?{ws}*(?<!\w)import\b"
+    import_ = r"import(?P<names>(?:[^\r\n;#\\]|\\\r?\n|\\)*)"
+    alias = r"\s*({name}(?:\s*\.\s*{name})*)(?:\s+as\s+({name}))?\s*$"
+
+    def __init__(self, kind):
+        def compile_(pattern):
+            pattern = pattern.format(ws=self.ws, name=self.name)
+            return re.compile(pattern.encode() if kind is bytes else pattern)
+
+        self.kind = kind
+        self.token = compile_(self.token)
+        self.from_ = compile_(self.from_)
+        self.import_ = compile_(self.import_)
+        self.alias = compile_(self.alias)
+
+    def text(self, value):
+        return value.encode() if self.kind is bytes else value
+
+    def name_of(self, value):
+        # Drop line continuations and the blanks around dots.
+        value = self.text("").join(value.replace(self.text("\\"), self.text(" ")).split())
+        return value.decode("ascii") if self.kind is bytes else value
+
+
+@functools.lru_cache(maxsize=None)
+def _token_patterns(kind):
+    return _TokenPatterns(kind)
+
+
+def _at_statement_start(contents, pos):
+    """Whether only blanks separate *pos* from the start of a statement."""
+    while pos > 0:
+        char = contents[pos - 1: pos]
+        if char in (" ", "\t", "\f", b" ", b"\t", b"\f"):
+            pos -= 1
+        elif char in ("\n", b"\n"):
+            end = pos - 1
+            if contents[end - 1: end] in ("\r", b"\r"):
+                end -= 1
+            if contents[end - 1: end] not in ("\\", b"\\"):
+                return True
+            pos = end - 1
+        else:
+            return char in ("\r", ";", ":", b"\r", b";", b":")
+    return True
+
+
+def _scan_import_tokens(contents):
+    """Find the imports of *contents* without building its syntax tree.
+
+    Strings and comments are skipped by a lexer that only recognises the
+    few tokens that matter, so the ``import`` and ``from`` keywords are
+    found at any nesting level.
+
+    Returns:
+        Set[str]: The same names as :func:`imports_from_source`, or
+            ``None`` if the source is ambiguous and must be parsed.
+
+    """
+    if not isinstance(contents, str):
+        encoding = _coding_cookie(contents)
+        if encoding is not None and not _bytes_scannable(encoding):
+            # ASCII bytes may be part of multi-byte characters (as in
+            # Shift JIS): scan the decoded text instead.
+            try:
+                contents = contents[:].decode(encoding)
+            except (LookupError, UnicodeDecodeError):
+                return None
+    patterns = _token_patterns(str if isinstance(contents, str) else bytes)
+    text = patterns.text
+    # find() rather than in, which only looks for single bytes in an mmap
+    if contents.find(text("import")) < 0:
+        return set()
+
+    raw_imports = set()
+    pos = 0
+    while True:
+        match = patterns.token.search(contents, pos)
+        if match is None:
+            return raw_imports
+        pos = match.end()
+        kind = match.lastgroup
+
+        if kind == "comment":
+            continue
+        if kind == "quote":
+            # An unterminated string: leave the error to the parser.
+            return None
+        if kind == "string":
+            if text("f") in match.group("prefix").lower():
+                # Since Python 3.12 the replacement fields of an f-string
+                # may reuse its quotes, which this lexer does not handle.
+                body = match.group("string").replace(text("{{"), text("")).replace(text("}}"), text(""))
+                if body.count(text("{")) != body.count(text("}")):
+                    return None
+            continue
+
+        start = match.start()
+        if match.group("keyword") == text("from"):
+            from_match = patterns.from_.match(contents, start)
+            if from_match is not None:
+                module = from_match.group("module")
+                raw_imports.add(patterns.name_of(module) if module else None)
+                pos = from_match.end()
+            elif _at_statement_start(contents, start):
+                return None
+            # Otherwise it is ``yield from`` or ``raise ... from``.
+            continue
+
+        if not _at_statement_start(contents, start):
+            return None
+        import_match = patterns.import_.match(contents, start)
+        pos = import_match.end()
+        names = import_match.group("names").replace(text("\\\r\n"), text(" ")).replace(text("\\\n"), text(" "))
+        for alias in names.split(text(",")):
+            alias_match = patterns.alias.match(alias)
+            if alias_match is None:
+                return None
+            name = patterns.name_of(alias_match.group(1))
+            parts = name.split(".")
+            if alias_match.group(2):
+                parts.append(patterns.name_of(alias_match.group(2)))
+            if any(keyword.iskeyword(part) for part in parts):
+                return None
+            raw_imports.add(name)
+
+
+_CODING_COOKIE = re.compile(rb"[ \t\f]*#.*?coding[:=][ \t]*([-\w.]+)", re.ASCII)
+_BLANK_OR_COMMENT = re.compile(rb"[ \t\f]*(?:[#\r\n]|$)")
+
+
+def _coding_cookie(contents):
+    """Return the encoding declared by a source in bytes (PEP 263), or ``None``."""
+    if contents[:3] == b"\xef\xbb\xbf":
+        return "utf-8"
+    start = 0
+    for _ in range(2):
+        end = contents.find(b"\n", start)
+        line = contents[start:end if end >= 0 else len(contents)]
+        match = _CODING_COOKIE.match(line)
+        if match:
+            return match.group(1).decode("ascii")
+        # The cookie may only be on the second line after a comment or a
+        # blank line.
+        if end < 0 or not _BLANK_OR_COMMENT.match(line):
+            return None
+        start = end + 1
+    return None
+
+
+def _bytes_scannable(encoding):
+    # Whether every ASCII byte is an ASCII character in encoding
+    try:
+        name = codecs.lookup(encoding).name
+    except LookupError:
+        return False
+    return name in ("ascii", "utf-8") or name.startswith(("iso8859-", "cp125"))
+
+
+def _is_decoding_error(exc):
+    # Whether the parser failed to decode a source rather than to parse it
+    message = str(exc.msg) if exc.msg else ""
+    return message.startswith("(unicode error)") or "encoding" in message
+
+
+def _make_batches(file_names, jobs):
+    sizes = {}
+    for file_name in file_names:
+        try:
+            sizes[file_name] = os.path.getsize(file_name)
+        except OSError:
+            sizes[file_name] = 0
+    # Largest files first, so that no worker is left with a big file
+    # while the others are idle at the end of the run.
+    ordered = sorted(file_names, key=lambda f: sizes[f], reverse=True)
+    budget = max(1, sum(sizes.values()) // (jobs * BATCHES_PER_JOB))
+
+    batches = []
+    batch, batch_size = [], 0
+    for file_name in ordered:
+        batch.append(file_name)
+        batch_size += sizes[file_name]
+        if batch_size >= budget or len(batch) >= MAX_BATCH_FILES:
+            batches.append(batch)
+            batch, batch_size = [], 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _init_worker(nbconvert=False):
+    if nbconvert:
+        # Set up the exporter once, not on the first notebook of each batch
+        _python_exporter()
 
 
 def get_file_extensions():
@@ -181,7 +1630,10 @@ def read_file_content(file_name: str, encoding="utf-8"):
         with open(file_name, "r", encoding=encoding) as f:
             contents = f.read()
     elif file_ext_is_allowed(file_name, [".ipynb"]) and scan_noteboooks:
-        contents = ipynb_2_py(file_name, encoding=encoding)
+        if use_nbconvert:
+            contents = ipynb_2_py(file_name, encoding=encoding)
+        else:
+            contents = notebook_to_python(file_name, encoding=encoding)
     return contents
 
 
@@ -200,12 +1652,265 @@ def ipynb_2_py(file_name, encoding="utf-8"):
         str: parsed string
 
     """
-    exporter = PythonExporter()
-    (body, _) = exporter.from_filename(file_name)
+    (body, _) = _python_exporter().from_filename(file_name)
 
     return body.encode(encoding)
 
 
+_exporters = threading.local()
+
+
+def _python_exporter():
+    # Creating an exporter loads its templates, so each thread keeps one
+    exporter = getattr(_exporters, "python", None)
+    if exporter is None:
+        from nbconvert import PythonExporter
+
+        exporter = _exporters.python = PythonExporter()
+    return exporter
+
+
+def notebook_to_python(file_name, encoding="utf-8"):
+    """Extract the python source of the code cells of a notebook.
+
+    The notebook is read incrementally, so cell outputs and attachments
+    are skipped without being loaded. IPython syntax is translated into
+    plain python: line magics, shell escapes and help requests become
+    ``pass``, assignments from them assign ``None``, and cell magics
+    other than those running python code (e.g. ``%%time``) drop their
+    cell.
+
+    Args:
+        file_name (str): notebook file path to parse as python script
+        encoding  (str): encoding of file
+
+    Returns:
+        str: the python source of the notebook
+
+    """
+    sources = []
+    with open(file_name, "r", encoding=encoding) as f:
+        reader = JsonReader(f)
+        for key in reader.iter_object():
+            if key == "cells":
+                sources.extend(_read_code_cells(reader, "source"))
+            elif key == "worksheets":
+                # nbformat 3 keeps the cells in worksheets and the code in "input"
+                for _ in reader.iter_array():
+                    for worksheet_key in reader.iter_object():
+                        if worksheet_key == "cells":
+                            sources.extend(_read_code_cells(reader, "input"))
+                        else:
+                            reader.skip_value()
+            else:
+                reader.skip_value()
+    return "\n".join(sources)
+
+
+def _read_code_cells(reader, field):
+    for _ in reader.iter_array():
+        cell_type, source = None, ""
+        for key in reader.iter_object():
+            if key == "cell_type":
+                cell_type = reader.read_value()
+            elif key == field:
+                source = reader.read_value()
+            else:
+                reader.skip_value()
+        if cell_type == "code":
+            if isinstance(source, list):
+                source = "".join(source)
+            yield _cell_to_python(source)
+
+
+class JsonReader:
+    """Pull parser reading a JSON document from a file in chunks.
+
+    Values the caller is not interested in are skipped without building
+    python objects for them, and without holding more than one chunk of
+    the document in memory.
+
+    Args:
+        f (file): The file to read, opened in text mode.
+        chunk_size (int): The number of characters read at a time.
+
+    """
+
+    _structure = re.compile(r'["\[\]{}]')
+    _scalar = re.compile(r"[^\s,\]}]*")
+    _space = re.compile(r"\s*")
+
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        # Start of the value being read, kept in the buffer while reading
+        self.start = None
+
+    def _fill(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            raise ValueError("Unexpected end of JSON document")
+        keep = self.pos if self.start is None else self.start
+        self.buffer = self.buffer[keep:] + chunk
+        self.pos -= keep
+        if self.start is not None:
+            self.start = 0
+
+    def _peek(self):
+        while True:
+            self.pos = self._space.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            self._fill()
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise ValueError("Expected {!r} at position {}, found {!r}".format(chars, self.pos, char))
+        self.pos += 1
+        return char
+
+    def _skip_string(self):
+        # str.find is much faster than a regular expression on the long
+        # strings of cell outputs
+        self.pos += 1
+        while True:
+            end = self.buffer.find('"', self.pos)
+            if end == -1:
+                end = len(self.buffer)
+            escape = self.buffer.find("\\", self.pos, end)
+            if escape == -1:
+                if end < len(self.buffer):
+                    self.pos = end + 1
+                    return
+                self.pos = end
+            elif escape + 1 < len(self.buffer):
+                self.pos = escape + 2
+                continue
+            else:
+                # The escaped character is in the next chunk
+                self.pos = escape
+            self._fill()
+
+    def _skip_scalar(self):
+        while True:
+            end = self._scalar.match(self.buffer, self.pos).end()
+            if end < len(self.buffer):
+                self.pos = end
+                return
+            self._fill()
+
+    def skip_value(self):
+        """Skip the next value."""
+        char = self._peek()
+        if char == '"':
+            return self._skip_string()
+        if char not in "[{":
+            return self._skip_scalar()
+        depth = 0
+        while True:
+            match = self._structure.search(self.buffer, self.pos)
+            if match is None:
+                self.pos = len(self.buffer)
+                self._fill()
+                continue
+            char = match.group()
+            if char == '"':
+                self.pos = match.start()
+                self._skip_string()
+                continue
+            self.pos = match.end()
+            depth += 1 if char in "[{" else -1
+            if depth == 0:
+                return
+
+    def read_value(self):
+        """Read the next value.
+
+        Returns:
+            The decoded value.
+
+        """
+        self._peek()
+        self.start = self.pos
+        try:
+            self.skip_value()
+            return json.loads(self.buffer[self.start:self.pos])
+        finally:
+            self.start = None
+
+    def iter_object(self):
+        """Iterate over the keys of the next value, an object.
+
+        The value of each key must be read or skipped before asking for
+        the next key.
+
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            if self._peek() != '"':
+                raise ValueError("Expected an object key at position {}".format(self.pos))
+            key = self.read_value()
+            self._expect(":")
+            yield key
+            if self._expect(",}") == "}":
+                return
+
+    def iter_array(self):
+        """Iterate over the next value, an array.
+
+        Each item must be read or skipped before asking for the next one.
+
+        """
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self._expect(",]") == "]":
+                return
+
+
+# Cell magics whose body is python code executed by the kernel.
+PYTHON_CELL_MAGICS = frozenset(["capture", "prun", "python", "python3", "time", "timeit"])
+_MAGIC_LINE = re.compile(r"(\s*)(?:%{1,2}\w|!(?!=)|\?)")
+_MAGIC_ASSIGNMENT = re.compile(r"(\s*)([\w.,()\[\] ]+?)\s*=\s*(?:%{1,2}\w|!(?!=))")
+_HELP_LINE = re.compile(r"(\s*)[\w.]+\?{1,2}\s*$")
+
+
+def _cell_to_python(source):
+    lines = source.splitlines()
+    if lines and lines[0].startswith("%%"):
+        magic = lines[0][2:].split(None, 1)
+        if not magic or magic[0] not in PYTHON_CELL_MAGICS:
+            return ""
+        lines[0] = ""
+
+    continued = False
+    for i, line in enumerate(lines):
+        if continued:
+            # The previous magic continues on this line
+            continued = line.endswith("\\")
+            lines[i] = ""
+            continue
+        match = _MAGIC_LINE.match(line) or _HELP_LINE.match(line)
+        if match:
+            lines[i] = match.group(1) + "pass"
+        else:
+            match = _MAGIC_ASSIGNMENT.match(line)
+            if not match:
+                continue
+            lines[i] = "%s%s = None" % match.group(1, 2)
+        continued = line.endswith("\\")
+    return "\n".join(lines)
+
+
 def generate_requirements_file(path, imports, symbol):
     with _open(path, "w") as out_file:
         logging.debug(
@@ -227,99 +1932,648 @@ def output_requirements(imports, symbol):
     generate_requirements_file("-", imports, symbol)
 
 
-def get_imports_info(imports, pypi_server="https://pypi.python.org/pypi/", proxy=None):
-    result = []
+class Resolver:
+    """Resolve imports to the packages providing them.
 
-    for item in imports:
-        try:
-            logging.warning(
-                'Import named "%s" not found locally. ' "Trying to resolve it at the PyPI server.",
-                item,
+    The index of the local environment is built once, and the session to
+    the PyPI server is opened on first use, both to be reused by every
+    call to :meth:`resolve`. One resolver can be shared by any number of
+    threads.
+
+    Args:
+        use_local (bool): Resolve imports with the local environment only.
+        pypi_server (str): Base URL of the PyPI JSON API.
+        proxy (dict): Proxies passed on to requests.
+        concurrency (int): Maximum number of PyPI lookups running at once.
+        index_file (str): Resolve imports with this package index (see
+            :func:`build_package_index`) instead of the PyPI server.
+        cache_dir (str): Directory of the environment and PyPI caches;
+            ``None`` disables them.
+        cache_ttl (int): Number of seconds a cached PyPI lookup stays
+            fresh.
+        refresh (bool): Revalidate every cached PyPI lookup.
+        offline (bool): Only use the PyPI cache, never the server.
+        encoding (str): Encoding of the metadata of local packages.
+        profile (Profile): Record the metrics of the lookups.
+
+    """
+
+    def __init__(
+        self,
+        use_local=False,
+        pypi_server="https://pypi.python.org/pypi/",
+        proxy=None,
+        concurrency=DEFAULT_PYPI_CONCURRENCY,
+        index_file=None,
+        cache_dir=None,
+        cache_ttl=DEFAULT_PYPI_CACHE_TTL,
+        refresh=False,
+        offline=False,
+        encoding="utf-8",
+        profile=None,
+    ):
+        self.use_local = use_local
+        self.pypi_server = pypi_server
+        self.proxy = proxy
+        self.concurrency = concurrency
+        self.index_file = index_file
+        self.cache_dir = cache_dir
+        self.cache_ttl = cache_ttl
+        self.refresh = refresh
+        self.offline = offline
+        self.profile = profile
+        with _profile_phase(profile, "local_packages"):
+            self.local_index = LocalPackageIndex(get_locally_installed_packages(encoding, cache_dir=cache_dir))
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """The :class:`requests.Session` to the PyPI server."""
+        with self._lock:
+            if self._session is None:
+                self._session = pypi_session(self.concurrency)
+            return self._session
+
+    def resolve(self, imports):
+        """Return the packages providing *imports*.
+
+        Args:
+            imports (List[str]): Top level names of imported modules, as
+                returned by :meth:`Scanner.get_all_imports`.
+
+        Returns:
+            List[dict]: The ``name`` and ``version`` of each package,
+                sorted by name.
+
+        """
+        return self.resolve_projects({None: imports})[None]
+
+    def resolve_projects(self, project_imports):
+        """Resolve the imports of several projects at once.
+
+        Each package missing locally is looked up once, however many
+        projects import it.
+
+        Args:
+            project_imports (Dict[str, List[str]]): The imports of each
+                project, as returned by :meth:`Scanner.get_project_imports`.
+
+        Returns:
+            Dict[str, List[dict]]: The packages of each project, as
+                returned by :meth:`resolve`.
+
+        """
+        plans = {}
+        for project, imports in project_imports.items():
+            with _profile_phase(self.profile, "local_resolve"):
+                candidates = get_pkg_names(imports)
+                local = get_import_local(candidates, index=self.local_index)
+            logging.debug("Found imports: " + ", ".join(candidates))
+            if self.use_local:
+                difference = []
+            else:
+                # check if candidate name is found in
+                # the list of exported modules, installed locally
+                # and the package name is not in the list of local module names
+                # it add to difference
+                local_found = LocalPackageIndex(local)
+                difference = [x for x in candidates if not local_found.provides(x)]
+            plans[project] = (local, difference)
+
+        if self.use_local:
+            logging.debug("Getting package information ONLY from local installation.")
+            remote = {}
+        else:
+            logging.debug("Getting packages information from Local/PyPI")
+            missing = list(dict.fromkeys(name for _, difference in plans.values() for name in difference))
+            remote = {info["name"]: info for info in self._resolve_remote(missing)}
+
+        # sort imports based on lowercase name of package, similar to `pip freeze`.
+        return {
+            project: sorted(
+                local + [remote[name] for name in difference if name in remote], key=lambda x: x["name"].lower()
             )
-            response = requests.get("{0}{1}/json".format(pypi_server, item), proxies=proxy)
-            if response.status_code == 200:
-                if hasattr(response.content, "decode"):
-                    data = json2package(response.content.decode())
-                else:
-                    data = json2package(response.content)
-            elif response.status_code >= 300:
-                raise HTTPError(status_code=response.status_code, reason=response.reason)
-        except HTTPError:
-            logging.warning('Package "%s" does not exist or network problems', item)
-            continue
+            for project, (local, difference) in plans.items()
+        }
+
+    def _resolve_remote(self, names):
+        if self.index_file:
+            with _profile_phase(self.profile, "package_index"):
+                return get_imports_info_from_index(names, self.index_file)
+        with _profile_phase(self.profile, "pypi"):
+            return get_imports_info(
+                names,
+                proxy=self.proxy,
+                pypi_server=self.pypi_server,
+                concurrency=self.concurrency,
+                cache_dir=self.cache_dir,
+                cache_ttl=self.cache_ttl,
+                refresh=self.refresh,
+                offline=self.offline,
+                session=self.session,
+                profile=self.profile,
+            )
+
+    def close(self):
+        """Close the session to the PyPI server."""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+def get_imports_info(
+    imports,
+    pypi_server="https://pypi.python.org/pypi/",
+    proxy=None,
+    concurrency=DEFAULT_PYPI_CONCURRENCY,
+    cache_dir=None,
+    cache_ttl=DEFAULT_PYPI_CACHE_TTL,
+    refresh=False,
+    offline=False,
+    session=None,
+    profile=None,
+):
+    """Resolve imports to their latest release on a PyPI server.
+
+    Up to *concurrency* lookups run at the same time, over a single
+    keep-alive session. The result keeps the order of *imports*; imports
+    that cannot be resolved are left out.
+
+    Args:
+        imports (List[str]): Names to look up.
+        pypi_server (str): Base URL of the PyPI JSON API.
+        proxy (dict): Proxies passed on to requests.
+        concurrency (int): Maximum number of lookups running at once.
+        cache_dir (str): Directory of the :class:`PyPICache`; ``None``
+            disables the cache.
+        cache_ttl (int): Number of seconds a cached lookup stays fresh.
+        refresh (bool): Revalidate every cached lookup, however fresh.
+        offline (bool): Only use the cache, whatever the age of its
+            entries, and never contact the server.
+        session (requests.Session): The session to use, see
+            :func:`pypi_session`. By default a new one is opened and closed.
+        profile (Profile): Record the latency of each request.
+
+    Returns:
+        List[dict]: The ``name`` and ``version`` of each resolved import.
+
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    imports = list(imports)
+    cache = PyPICache(cache_dir, cache_ttl) if cache_dir else None
+    own_session = session is None
+    if own_session:
+        session = pypi_session(concurrency)
+    try:
+        def get_info(item):
+            return get_import_info(item, session, pypi_server, proxy, cache, refresh, offline, profile)
+
+        if concurrency > 1 and len(imports) > 1 and not offline:
+            with ThreadPoolExecutor(max_workers=min(concurrency, len(imports))) as executor:
+                infos = list(executor.map(get_info, imports))
+        else:
+            infos = [get_info(item) for item in imports]
+    finally:
+        if own_session:
+            session.close()
+    if cache:
+        cache.save()
+    return [info for info in infos if info is not None]
+
+
+def pypi_session(concurrency=DEFAULT_PYPI_CONCURRENCY):
+    """Return a :class:`requests.Session` sized for *concurrency* threads."""
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(1, concurrency))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_import_info(
+    item,
+    session,
+    pypi_server="https://pypi.python.org/pypi/",
+    proxy=None,
+    cache=None,
+    refresh=False,
+    offline=False,
+    profile=None,
+):
+    """Resolve a single import with *session*, or return ``None``."""
+    from yarg import json2package
+    from yarg.exceptions import HTTPError
+
+    url = "{0}{1}/json".format(pypi_server, item)
+    entry = cache.get(url) if cache else None
+    if entry and (offline or (not refresh and cache.is_fresh(entry))):
+        logging.debug('Import named "%s" was found in the PyPI cache.', item)
+        return _cached_import_info(item, entry)
+    if offline:
+        logging.warning('Import named "%s" not found locally nor in the PyPI cache.', item)
+        return None
+
+    headers = {}
+    if entry and entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    try:
         logging.warning(
-            'Import named "%s" was resolved to "%s:%s" package (%s).\n'
-            "Please, verify manually the final list of requirements.txt "
-            "to avoid possible dependency confusions.",
+            'Import named "%s" not found locally. ' "Trying to resolve it at the PyPI server.",
             item,
-            data.name,
-            data.latest_release_id,
-            data.pypi_url,
         )
-        result.append({"name": item, "version": data.latest_release_id})
+        start = time.perf_counter()
+        response = None
+        try:
+            response = session.get(url, proxies=proxy, headers=headers)
+        finally:
+            if profile is not None:
+                profile.request(time.perf_counter() - start, response.status_code if response is not None else None)
+        if response.status_code == 304 and entry:
+            cache.touch(url)
+            return _cached_import_info(item, entry)
+        if response.status_code == 200:
+            if hasattr(response.content, "decode"):
+                data = json2package(response.content.decode())
+            else:
+                data = json2package(response.content)
+        elif response.status_code >= 300:
+            if cache and response.status_code == 404:
+                cache.put(url)
+            raise HTTPError(status_code=response.status_code, reason=response.reason)
+    except HTTPError:
+        logging.warning('Package "%s" does not exist or network problems', item)
+        return None
+    if cache:
+        cache.put(url, data.name, data.latest_release_id, response.headers.get("ETag"))
+    logging.warning(
+        'Import named "%s" was resolved to "%s:%s" package (%s).\n'
+        "Please, verify manually the final list of requirements.txt "
+        "to avoid possible dependency confusions.",
+        item,
+        data.name,
+        data.latest_release_id,
+        data.pypi_url,
+    )
+    return {"name": item, "version": data.latest_release_id}
+
+
+def _cached_import_info(item, entry):
+    if entry["name"] is None:
+        logging.warning('Package "%s" does not exist (cached)', item)
+        return None
+    return {"name": item, "version": entry["version"]}
+
+
+def normalize_name(name):
+    """Normalize a project name as described in PEP 503."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def build_package_index(source, index_file):
+    """Build a local package index from a directory of PyPI JSON documents.
+
+    Every ``*.json`` file below *source* that looks like a response of the
+    PyPI JSON API (``/<project>/json``) contributes its project name and
+    latest version. When a project appears more than once, the last
+    document read wins.
+
+    Args:
+        source (str): Directory holding the JSON documents.
+        index_file (str): Path of the SQLite index to (re)create.
+
+    Returns:
+        int: The number of projects in the index.
+
+    """
+    projects = {}
+    for root, _, files in os.walk(source):
+        for file_name in sorted(files):
+            if not file_name.endswith(".json"):
+                continue
+            file_name = os.path.join(root, file_name)
+            try:
+                with open(file_name, "r", encoding="utf-8") as f:
+                    info = json.load(f)["info"]
+                name, version = info["name"], info["version"]
+            except (OSError, ValueError, KeyError, TypeError):
+                logging.debug("Skipping %s: not a PyPI JSON document", file_name)
+                continue
+            projects[normalize_name(name)] = (name, version)
+
+    import sqlite3
+
+    directory = os.path.dirname(os.path.abspath(index_file))
+    fd, tmp_name = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".sqlite")
+    os.close(fd)
+    try:
+        with closing(sqlite3.connect(tmp_name)) as connection, connection:
+            connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            connection.execute("INSERT INTO meta VALUES ('version', ?)", (str(PACKAGE_INDEX_VERSION),))
+            connection.execute(
+                "CREATE TABLE packages (key TEXT PRIMARY KEY, name TEXT, version TEXT) WITHOUT ROWID"
+            )
+            connection.executemany(
+                "INSERT INTO packages VALUES (?, ?, ?)",
+                ((key, name, version) for key, (name, version) in sorted(projects.items())),
+            )
+        os.replace(tmp_name, index_file)
+    except BaseException:
+        os.remove(tmp_name)
+        raise
+    logging.info("Indexed {} projects in {}".format(len(projects), index_file))
+    return len(projects)
+
+
+class PackageIndex:
+    """Read-only access to an index built by :func:`build_package_index`."""
+
+    def __init__(self, index_file):
+        if not os.path.isfile(index_file):
+            raise FileNotFoundError("Package index {} does not exist".format(index_file))
+        import sqlite3
+        from urllib.request import pathname2url
+
+        self.connection = sqlite3.connect("file:{}?mode=ro".format(pathname2url(index_file)), uri=True)
+        (version,) = self.connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if version != str(PACKAGE_INDEX_VERSION):
+            self.close()
+            raise ValueError("Package index {} has an unsupported format, rebuild it".format(index_file))
+
+    def lookup(self, name):
+        """Return the ``(name, version)`` of project *name*, or ``None``."""
+        return self.connection.execute(
+            "SELECT name, version FROM packages WHERE key = ?", (normalize_name(name),)
+        ).fetchone()
+
+    def close(self):
+        self.connection.close()
+
+
+def get_imports_info_from_index(imports, index_file):
+    """Resolve imports against a local package index instead of PyPI.
+
+    Args:
+        imports (List[str]): Names to look up.
+        index_file (str): Index built by :func:`build_package_index`.
+
+    Returns:
+        List[dict]: The ``name`` and ``version`` of each resolved import,
+            in the order of *imports*.
+
+    """
+    result = []
+    index = PackageIndex(index_file)
+    try:
+        for item in imports:
+            found = index.lookup(item)
+            if found is None:
+                logging.warning('Import named "%s" not found locally nor in the package index.', item)
+                continue
+            logging.debug('Import named "%s" was resolved to "%s:%s" by the package index.', item, *found)
+            result.append({"name": item, "version": found[1]})
+    finally:
+        index.close()
     return result
 
 
-def get_locally_installed_packages(encoding="utf-8"):
+def get_locally_installed_packages(encoding="utf-8", cache_dir=None):
+    """List the distributions installed in the directories of ``sys.path``.
+
+    Only the ``*.dist-info`` and ``*.egg-info`` directories directly inside
+    each directory (and the ``EGG-INFO`` of ``*.egg`` directories) are
+    read; package sources are never walked.
+
+    Args:
+        encoding (str): Encoding of the metadata files.
+        cache_dir (str): Directory where a snapshot of the environment is
+            kept, keyed by the interpreter and the modification times of
+            the ``sys.path`` directories. ``None`` disables the snapshot.
+
+    Returns:
+        List[dict]: The ``name``, ``version`` and exported top-level
+            modules (``exports``) of each distribution.
+
+    """
+    site_dirs = []
+    for path in sys.path:
+        path = os.path.realpath(path or os.curdir)
+        if path not in site_dirs:
+            site_dirs.append(path)
+
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, "environments.json")
+        key = _environment_key(site_dirs, encoding)
+        entry = _load_json(cache_file, ENVIRONMENT_CACHE_VERSION).get(sys.executable)
+        if entry and entry["key"] == key:
+            logging.debug("Using the cached snapshot of the local environment")
+            return entry["packages"]
+
+    packages = _scan_site_dirs(site_dirs, encoding)
+
+    if cache_dir:
+        try:
+            with _file_lock(cache_file + ".lock"):
+                environments = _load_json(cache_file, ENVIRONMENT_CACHE_VERSION)
+                environments[sys.executable] = {"key": key, "packages": packages}
+                _write_json_atomic(cache_file, {"version": ENVIRONMENT_CACHE_VERSION, "entries": environments})
+        except OSError as error:
+            logging.warning("Could not save the local environment to %s: %s", cache_file, error)
+    return packages
+
+
+def _environment_key(site_dirs, encoding):
+    # Installing or removing a distribution adds or removes a metadata
+    # directory, which changes the modification time of its parent.
+    paths = []
+    for path in site_dirs:
+        try:
+            paths.append([path, os.stat(path).st_mtime_ns])
+        except OSError:
+            paths.append([path, None])
+    return {"encoding": encoding, "paths": paths}
+
+
+def _scan_site_dirs(site_dirs, encoding="utf-8"):
     packages = []
     ignore = ["tests", "_tests", "egg", "EGG", "info"]
-    for path in sys.path:
-        for root, dirs, files in os.walk(path):
-            for item in files:
-                if "top_level" in item:
-                    item = os.path.join(root, item)
-                    with open(item, "r", encoding=encoding) as f:
-                        package = root.split(os.sep)[-1].split("-")
-                        try:
-                            top_level_modules = f.read().strip().split("\n")
-                        except:  # NOQA
-                            # TODO: What errors do we intend to suppress here?
-                            continue
-
-                        # filter off explicitly ignored top-level modules
-                        # such as test, egg, etc.
-                        filtered_top_level_modules = list()
-
-                        for module in top_level_modules:
-                            if (module not in ignore) and (package[0] not in ignore):
-                                # append exported top level modules to the list
-                                filtered_top_level_modules.append(module)
-
-                        version = None
-                        if len(package) > 1:
-                            version = package[1].replace(".dist", "").replace(".egg", "")
-
-                        # append package: top_level_modules pairs
-                        # instead of top_level_module: package pairs
-                        packages.append(
-                            {
-                                "name": package[0],
-                                "version": version,
-                                "exports": filtered_top_level_modules,
-                            }
-                        )
+    for path in site_dirs:
+        for metadata_dir in _find_metadata_dirs(path):
+            try:
+                package = _read_distribution(metadata_dir, encoding)
+            except (OSError, UnicodeDecodeError):
+                logging.debug("Could not read the metadata in %s", metadata_dir)
+                continue
+
+            # filter off explicitly ignored top-level modules
+            # such as test, egg, etc.
+            if package["name"] in ignore:
+                package["exports"] = []
+            else:
+                package["exports"] = [module for module in package["exports"] if module not in ignore]
+            packages.append(package)
     return packages
 
 
-def get_import_local(imports, encoding="utf-8"):
-    local = get_locally_installed_packages()
-    result = []
-    for item in imports:
-        # search through local packages
-        for package in local:
-            # if candidate import name matches export name
-            # or candidate import name equals to the package name
-            # append it to the result
-            if item in package["exports"] or item == package["name"]:
-                result.append(package)
+def _find_metadata_dirs(path):
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if not entry.is_dir():
+                continue
+        except OSError:
+            continue
+        if entry.name.endswith((".dist-info", ".egg-info")):
+            yield entry.path
+        elif entry.name.endswith(".egg") and os.path.isdir(os.path.join(entry.path, "EGG-INFO")):
+            yield os.path.join(entry.path, "EGG-INFO")
+
+
+def _read_distribution(metadata_dir, encoding="utf-8"):
+    """Read the name, version and top-level modules of a distribution."""
+    headers = {}
+    for metadata_file in ("METADATA", "PKG-INFO"):
+        metadata_file = os.path.join(metadata_dir, metadata_file)
+        if os.path.isfile(metadata_file):
+            headers = _read_metadata_headers(metadata_file, encoding)
+            break
+
+    # Fall back to the directory name, as in "name-version.dist-info".
+    dir_name = os.path.basename(metadata_dir)
+    if dir_name == "EGG-INFO":
+        dir_name = os.path.basename(os.path.dirname(metadata_dir))
+    dir_parts = os.path.splitext(dir_name)[0].split("-")
+    name = headers.get("name") or dir_parts[0]
+    version = headers.get("version") or (dir_parts[1] if len(dir_parts) > 1 else None)
+
+    top_level = os.path.join(metadata_dir, "top_level.txt")
+    record = os.path.join(metadata_dir, "RECORD")
+    if os.path.isfile(top_level):
+        with open(top_level, "r", encoding=encoding) as f:
+            exports = [module for module in f.read().strip().split("\n") if module]
+    elif os.path.isfile(record):
+        exports = _top_level_from_record(record, encoding)
+    else:
+        exports = []
+    return {"name": name, "version": version, "exports": exports}
+
+
+def _read_metadata_headers(metadata_file, encoding="utf-8"):
+    # The headers end at the first blank line, before the (possibly
+    # long) description.
+    headers = {}
+    with open(metadata_file, "r", encoding=encoding, errors="replace") as f:
+        for line in f:
+            if not line.strip():
+                break
+            key, sep, value = line.partition(":")
+            if sep and key.lower() in ("name", "version"):
+                headers.setdefault(key.lower(), value.strip())
+    return headers
+
+
+def _top_level_from_record(record, encoding="utf-8"):
+    """Guess the top-level modules of a distribution from its RECORD."""
+    exports = []
+    with open(record, "r", encoding=encoding, newline="") as f:
+        for row in csv.reader(f):
+            if not row:
+                continue
+            parts = row[0].replace("\\", "/").split("/")
+            if len(parts) > 1:
+                module = parts[0]
+                if module.endswith((".dist-info", ".egg-info", ".data")):
+                    continue
+            else:
+                module, ext = os.path.splitext(parts[0])
+                if ext not in (".py", ".pyc", ".so", ".pyd"):
+                    continue
+                # Extension modules look like "name.cpython-312-x86_64-linux-gnu.so"
+                module = module.split(".")[0]
+            if module.isidentifier() and module != "__pycache__" and not module.startswith("__editable__"):
+                if module not in exports:
+                    exports.append(module)
+    return exports
+
+
+class LocalPackageIndex:
+    """Lookup tables over the locally installed packages.
 
-    # removing duplicates of package/version
-    # had to use second method instead of the previous one,
-    # because we have a list in the 'exports' field
-    # https://stackoverflow.com/questions/9427163/remove-duplicate-dict-in-list-in-python
-    result_unique = [i for n, i in enumerate(result) if i not in result[n + 1:]]
+    Args:
+        packages (List[dict]): The packages, as returned by
+            :func:`get_locally_installed_packages`. Defaults to the
+            packages installed in the current environment.
+
+    Attributes:
+        packages (List[dict]): The indexed packages.
+        modules (Dict[str, List[int]]): Maps each exported module and
+            each package name to the positions of the matching packages.
+        exports (Set[str]): The modules exported by any package.
+        names (Set[str]): The names of all packages.
+
+    """
 
-    return result_unique
+    def __init__(self, packages=None):
+        if packages is None:
+            packages = get_locally_installed_packages()
+        self.packages = packages
+        self.modules = {}
+        self.exports = set()
+        self.names = set()
+        for position, package in enumerate(packages):
+            self.exports.update(package["exports"])
+            self.names.add(package["name"])
+            for module in set(package["exports"]) | {package["name"]}:
+                self.modules.setdefault(module, []).append(position)
+
+    def find(self, imports):
+        """Return the packages exporting or named after any of *imports*.
+
+        Duplicated package/version entries are removed, keeping the last
+        occurrence of each.
+
+        """
+        result = [self.packages[position] for item in imports for position in self.modules.get(item, ())]
+
+        seen = set()
+        result_unique = []
+        for package in reversed(result):
+            key = (package["name"], package["version"], tuple(package["exports"]))
+            if key not in seen:
+                seen.add(key)
+                result_unique.append(package)
+        result_unique.reverse()
+        return result_unique
+
+    def provides(self, name):
+        """Whether *name*, lowercased, is a local export or package name."""
+        name = name.lower()
+        return name in self.exports or name in self.names
+
+
+def get_import_local(imports, encoding="utf-8", index=None):
+    """Find the locally installed packages that provide *imports*.
+
+    Args:
+        imports (List[str]): Names to look up.
+        encoding (str): Unused, kept for backward compatibility.
+        index (LocalPackageIndex): The local packages to search; defaults
+            to the packages installed in the current environment.
+
+    Returns:
+        List[dict]: The matching packages, without duplicates.
+
+    """
+    if index is None:
+        index = LocalPackageIndex()
+    return index.find(imports)
 
 
 def get_pkg_names(pkgs):
@@ -333,8 +2587,7 @@ def get_pkg_names(pkgs):
 
     """
     result = set()
-    with open(join("mapping"), "r") as f:
-        data = dict(x.strip().split(":") for x in f)
+    data = get_mapping()
     for pkg in pkgs:
         # Look up the mapped requirement. If a mapping isn't found,
         # simply use the package name.
@@ -355,6 +2608,68 @@ def join(f):
     return os.path.join(os.path.dirname(__file__), f)
 
 
+@functools.lru_cache(maxsize=None)
+def get_mapping():
+    """Return the mapping of import names to PyPI package names.
+
+    The ``mapping`` file is read once; the result is read-only.
+
+    """
+    with open(join("mapping"), "r") as f:
+        return MappingProxyType(dict(x.strip().split(":") for x in f))
+
+
+@functools.lru_cache(maxsize=None)
+def get_stdlib_modules(target_python=None):
+    """Return the names of the standard library modules.
+
+    Args:
+        target_python (str): A Python version such as ``"3.12"``. Without
+            it, the bundled ``stdlib`` file, which merges the modules of
+            many Python versions, is used.
+
+    Returns:
+        FrozenSet[str]: The top-level module names. For the running
+            Python version they come from ``sys.stdlib_module_names``,
+            for other versions from a matching interpreter on the
+            ``PATH``, falling back to the bundled list.
+
+    """
+    if target_python is not None:
+        if not re.match(r"^\d+\.\d+$", target_python):
+            raise ValueError("Invalid target Python version {}, use X.Y instead".format(target_python))
+        if target_python == "{}.{}".format(*sys.version_info[:2]) and hasattr(sys, "stdlib_module_names"):
+            return frozenset(sys.stdlib_module_names)
+        modules = _query_stdlib_modules(target_python)
+        if modules is not None:
+            return modules
+        logging.warning(
+            "Could not list the standard library of Python %s, using the bundled list instead.", target_python
+        )
+
+    with open(join("stdlib"), "r") as f:
+        return frozenset(x.strip() for x in f)
+
+
+def _query_stdlib_modules(target_python):
+    import subprocess
+
+    interpreter = shutil.which("python" + target_python)
+    if interpreter is None:
+        return None
+    try:
+        output = subprocess.run(
+            [interpreter, "-c", "import sys; print('\\n'.join(sys.stdlib_module_names))"],
+            capture_output=True,
+            check=True,
+            text=True,
+            timeout=30,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return frozenset(output.split())
+
+
 def parse_requirements(file_):
     """Parse a requirements formatted file.
 
@@ -492,23 +2807,309 @@ def handle_scan_noteboooks():
     if not scan_noteboooks:
         logging.info("Not scanning for jupyter notebooks.")
         return
+    if not use_nbconvert:
+        return
 
     try:
-        global PythonExporter
-        from nbconvert import PythonExporter
+        import nbconvert  # noqa: F401
     except ImportError:
         raise NbconvertNotInstalled()
 
 
+class ImportIndex:
+    """The imports of each file of a project, kept up to date incrementally.
+
+    After the first :meth:`refresh`, only the files whose modification
+    time or size changed are parsed again. Files that fail to parse keep
+    the imports found last time, as they are often being edited. The
+    parse cache of the scanner is used by the walks of the whole project;
+    it is only loaded once a changed file needs parsing, and then kept
+    for the life of the index.
+
+    Args:
+        scanner (Scanner): Finds and parses the files of the project.
+        path (str): The project directory.
+
+    """
+
+    def __init__(self, scanner, path):
+        self.scanner = scanner
+        self.path = path
+        self.directories = set()
+        self.stamps = {}
+        self.file_imports = {}
+        # Number of files importing each top level name, and of modules
+        # and directories of the project with each name.
+        self.counts = collections.Counter()
+        self.module_counts = collections.Counter()
+        self.directory_counts = collections.Counter()
+        self.ignore = None
+        self.cache = None
+
+    def refresh(self, file_names=None):
+        """Parse the new and modified files again, and forget deleted ones.
+
+        Args:
+            file_names (Iterable[str]): The files that may have changed;
+                by default the whole project is walked again.
+
+        Returns:
+            bool: Whether any file was added, modified or deleted.
+
+        """
+        use_cache = file_names is None and bool(self.scanner.cache_dir)
+        if file_names is None:
+            self.ignore = self.scanner.ignore_matcher(self.path)
+            directories = set()
+            current = set(self.scanner.walk(self.path, directories=directories))
+            deleted = self.stamps.keys() - current
+            self.directories = directories
+            self.directory_counts = collections.Counter(os.path.basename(d) for d in directories)
+        else:
+            current, deleted = set(), set()
+            for file_name in file_names:
+                if self._ignored(file_name):
+                    continue
+                if os.path.splitext(file_name)[1] in self.scanner.extensions and os.path.isfile(file_name):
+                    current.add(file_name)
+                elif file_name in self.stamps:
+                    deleted.add(file_name)
+
+        changed = bool(deleted)
+        for file_name in deleted:
+            self._remove(file_name)
+        for file_name in current:
+            try:
+                stat = os.stat(file_name)
+            except OSError:
+                if file_name in self.stamps:
+                    self._remove(file_name)
+                    changed = True
+                continue
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if self.stamps.get(file_name) != stamp:
+                self._update(file_name, stamp, use_cache)
+                changed = True
+        if self.cache:
+            self.cache.save()
+        return changed
+
+    def _ignored(self, file_name):
+        if self.ignore is None:
+            return False
+        return self.ignore.match(os.path.relpath(file_name, self.path).replace(os.sep, "/"))
+
+    def imports(self):
+        """Return the packages imported by the project, as :meth:`Scanner.get_all_imports`."""
+        local_names = self.module_counts.keys() | self.directory_counts.keys()
+        return [name for name in self.counts if name not in local_names and name not in self.scanner.stdlib]
+
+    def _update(self, file_name, stamp, use_cache=False):
+        label = self.scanner._parser_label(file_name)
+        cache = None
+        if use_cache:
+            if self.cache is None:
+                self.cache = ParseCache(self.scanner.cache_dir, self.path)
+            cache = self.cache
+        raw_imports = cache.lookup(file_name, label) if cache else None
+        if raw_imports is None:
+            try:
+                raw_imports = self.scanner._imports_of(file_name)
+            except Exception as exc:
+                logging.warning("Failed on file: %s (%s)", file_name, exc)
+                raw_imports = self.file_imports.get(file_name, set())
+            else:
+                if cache:
+                    cache.store(file_name, raw_imports, label)
+        if file_name not in self.stamps and file_ext_is_allowed(file_name, DEFAULT_EXTENSIONS):
+            _add_count(self.module_counts, os.path.splitext(os.path.basename(file_name))[0], 1)
+        for name in self.file_imports.get(file_name, ()):
+            _add_count(self.counts, name, -1)
+        self.stamps[file_name] = stamp
+        self.file_imports[file_name] = _top_level_names(raw_imports)
+        for name in self.file_imports[file_name]:
+            _add_count(self.counts, name, 1)
+
+    def _remove(self, file_name):
+        if file_ext_is_allowed(file_name, DEFAULT_EXTENSIONS):
+            _add_count(self.module_counts, os.path.splitext(os.path.basename(file_name))[0], -1)
+        for name in self.file_imports.pop(file_name, ()):
+            _add_count(self.counts, name, -1)
+        del self.stamps[file_name]
+
+
+def _add_count(counts, name, delta):
+    counts[name] += delta
+    if not counts[name]:
+        del counts[name]
+
+
+class _Inotify:
+    """Minimal binding of the Linux inotify API, watching directories.
+
+    Raises:
+        OSError: inotify is not available, or the limit of watches is
+            reached.
+
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, ignore_dirs=frozenset()):
+        import ctypes
+        import ctypes.util
+
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.ignore_dirs = ignore_dirs
+        self.watches = {}
+        self.directories = set()
+
+    def watch(self, directories):
+        """Watch the *directories* not watched yet."""
+        import ctypes
+
+        for directory in directories - self.directories:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed on %s" % directory)
+            self.watches[wd] = directory
+            self.directories.add(directory)
+
+    def read(self, timeout):
+        """Wait up to *timeout* seconds for changes.
+
+        Returns:
+            Set[str]: The changed files, or ``None`` when directories
+                changed too, and the whole project should be walked again.
+
+        """
+        import select
+
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        data = os.read(self.fd, 1 << 16)
+        changed = set()
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, pos)
+            name = data[pos + self.EVENT.size: pos + self.EVENT.size + length].rstrip(b"\0")
+            pos += self.EVENT.size + length
+            if mask & self.IN_Q_OVERFLOW or (mask & self.IN_ISDIR and os.fsdecode(name) not in self.ignore_dirs):
+                changed = None
+            elif changed is not None and wd in self.watches:
+                changed.add(os.path.join(self.watches[wd], os.fsdecode(name)))
+        if changed is None:
+            # Watches of deleted directories are gone, they are set up
+            # again for the directories that are still there.
+            self.watches.clear()
+            self.directories.clear()
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def watch_project(path, scanner, on_change, interval=WATCH_INTERVAL, stop=None):
+    """Call *on_change* with the imports of a project each time they change.
+
+    Changes are reported by inotify where available; otherwise the
+    project is walked again every *interval* seconds. Only the changed
+    files are parsed again.
+
+    Args:
+        path (str): The project directory.
+        scanner (Scanner): Finds and parses the files of the project.
+        on_change (Callable[[List[str]], None]): Called with the imports
+            of the project, as returned by :meth:`Scanner.get_all_imports`,
+            first with the initial imports.
+        interval (float): Seconds between two walks of the project.
+        stop (threading.Event): Stop watching once set; by default watch
+            until interrupted.
+
+    """
+    stop = stop or threading.Event()
+    index = ImportIndex(scanner, path)
+    index.refresh()
+
+    inotify = None
+    try:
+        inotify = _Inotify(scanner.ignore_dirs)
+        inotify.watch(index.directories)
+    except OSError as error:
+        logging.info("Watching %s by polling: %s", path, error)
+        if inotify is not None:
+            inotify.close()
+            inotify = None
+
+    try:
+        imports = set(index.imports())
+        on_change(sorted(imports))
+        while not stop.is_set():
+            if inotify is None:
+                stop.wait(interval)
+                changed = index.refresh()
+            else:
+                file_names = inotify.read(interval)
+                if file_names is None:
+                    changed = index.refresh()
+                    inotify.watch(index.directories)
+                else:
+                    changed = bool(file_names) and index.refresh(file_names)
+            if not changed:
+                continue
+            new_imports = set(index.imports())
+            if new_imports != imports:
+                imports = new_imports
+                on_change(sorted(imports))
+    finally:
+        if inotify is not None:
+            inotify.close()
+
+
 def init(args):
-    global scan_noteboooks
+    if args.get("build-index"):
+        build_package_index(args["<source>"], args["<index-file>"])
+        return
+
+    profile = Profile() if args.get("--profile") else None
+    profiler = None
+    if args.get("--cprofile"):
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        _init(args, profile)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args["--cprofile"])
+        if profile:
+            profile.save(args["--profile"])
+            logging.info("Saved the profile in " + args["--profile"])
+
+
+def _init(args, profile):
     encoding = args.get("--encoding")
     extra_ignore_dirs = args.get("--ignore")
     follow_links = not args.get("--no-follow-links")
     ignore_errors = args.get("--ignore-errors")
-
-    scan_noteboooks = args.get("--scan-notebooks", False)
-    handle_scan_noteboooks()
+    jobs = args.get("--jobs")
+    cache_dir = None if args.get("--no-cache") else args.get("--cache-dir") or default_cache_dir()
 
     input_path = args["<path>"]
 
@@ -519,12 +3120,36 @@ def init(args):
 
     if extra_ignore_dirs:
         extra_ignore_dirs = extra_ignore_dirs.split(",")
+    if jobs is not None:
+        jobs = int(jobs)
+
+    scanner = Scanner(
+        encoding=encoding,
+        extra_ignore_dirs=extra_ignore_dirs,
+        follow_links=follow_links,
+        ignore_errors=ignore_errors,
+        scan_notebooks=args.get("--scan-notebooks", False),
+        nbconvert=args.get("--nbconvert", False),
+        jobs=jobs,
+        cache_dir=cache_dir,
+        parser=args.get("--parser") or "ast",
+        target_python=args.get("--target-python"),
+        use_git=args.get("--git"),
+        profile=profile,
+    )
+    if not scanner.scan_notebooks:
+        logging.info("Not scanning for jupyter notebooks.")
+
+    projects = args.get("--projects")
+    if projects and (args.get("--watch") or args["--savepath"] or args["--diff"] or args["--clean"]):
+        raise ValueError("--projects cannot be combined with --watch, --savepath, --diff or --clean")
 
     path = (
         args["--savepath"] if args["--savepath"] else os.path.join(input_path, "requirements.txt")
     )
     if (
-        not args["--print"]
+        not projects
+        and not args["--print"]
         and not args["--savepath"]
         and not args["--force"]
         and os.path.exists(path)
@@ -532,15 +3157,6 @@ def init(args):
         logging.warning("requirements.txt already exists, " "use --force to overwrite it")
         return
 
-    candidates = get_all_imports(
-        input_path,
-        encoding=encoding,
-        extra_ignore_dirs=extra_ignore_dirs,
-        follow_links=follow_links,
-        ignore_errors=ignore_errors,
-    )
-    candidates = get_pkg_names(candidates)
-    logging.debug("Found imports: " + ", ".join(candidates))
     pypi_server = "https://pypi.python.org/pypi/"
     proxy = None
     if args["--pypi-server"]:
@@ -548,33 +3164,40 @@ def init(args):
 
     if args["--proxy"]:
         proxy = {"http": args["--proxy"], "https": args["--proxy"]}
-
-    if args["--use-local"]:
-        logging.debug("Getting package information ONLY from local installation.")
-        imports = get_import_local(candidates, encoding=encoding)
-    else:
-        logging.debug("Getting packages information from Local/PyPI")
-        local = get_import_local(candidates, encoding=encoding)
-
-        # check if candidate name is found in
-        # the list of exported modules, installed locally
-        # and the package name is not in the list of local module names
-        # it add to difference
-        difference = [
-            x
-            for x in candidates
-            if
-            # aggregate all export lists into one
-            # flatten the list
-            # check if candidate is in exports
-            x.lower() not in [y for x in local for y in x["exports"]] and
-            # check if candidate is package names
-            x.lower() not in [x["name"] for x in local]
-        ]
-
-        imports = local + get_imports_info(difference, proxy=proxy, pypi_server=pypi_server)
-    # sort imports based on lowercase name of package, similar to `pip freeze`.
-    imports = sorted(imports, key=lambda x: x["name"].lower())
+    pypi_concurrency = DEFAULT_PYPI_CONCURRENCY
+    if args.get("--pypi-concurrency"):
+        pypi_concurrency = int(args["--pypi-concurrency"])
+    cache_ttl = DEFAULT_PYPI_CACHE_TTL
+    if args.get("--cache-ttl"):
+        cache_ttl = int(args["--cache-ttl"])
+
+    resolver = Resolver(
+        use_local=args["--use-local"],
+        pypi_server=pypi_server,
+        proxy=proxy,
+        concurrency=pypi_concurrency,
+        index_file=args.get("--index-file"),
+        cache_dir=cache_dir,
+        cache_ttl=cache_ttl,
+        refresh=args.get("--refresh"),
+        offline=args.get("--offline"),
+        encoding=encoding,
+        profile=profile,
+    )
+    try:
+        if projects:
+            project_packages = resolver.resolve_projects(scanner.get_project_imports(input_path))
+            save_project_requirements(args, input_path, project_packages)
+            return
+        if args.get("--watch"):
+            def update(imports):
+                save_requirements(args, path, resolver.resolve(imports))
+
+            watch_project(input_path, scanner, update)
+            return
+        imports = resolver.resolve(scanner.get_all_imports(input_path))
+    finally:
+        resolver.close()
 
     if args["--diff"]:
         diff(args["--diff"], imports)
@@ -584,6 +3207,23 @@ def init(args):
         clean(args["--clean"], imports)
         return
 
+    save_requirements(args, path, imports)
+
+
+def save_project_requirements(args, path, project_packages):
+    """Write the requirements file of each project found under *path*."""
+    for project in sorted(project_packages):
+        requirements_path = os.path.join(project, "requirements.txt")
+        if args["--print"]:
+            print("# " + os.path.relpath(project, path))
+        elif not args["--force"] and os.path.exists(requirements_path):
+            logging.warning("%s already exists, use --force to overwrite it", requirements_path)
+            continue
+        save_requirements(args, requirements_path, project_packages[project])
+
+
+def save_requirements(args, path, imports):
+    """Write *imports* to *path*, or print them, as asked by the command line *args*."""
     if args["--mode"]:
         scheme = args.get("--mode")
         if scheme in ["compat", "gt", "no-pin"]:
@@ -604,6 +3244,8 @@ def init(args):
 
 
 def main():  # pragma: no cover
+    from docopt import docopt
+
     args = docopt(__doc__, version=__version__)
     log_level = logging.DEBUG if args["--debug"] else logging.INFO
     logging.basicConfig(level=log_level, format="%(levelname)s: %(message)s")
@@ -0,0 +1,60 @@
+"""Corner cases for the token-level import scanner.
+
+import not_a_module_in_docstring
+from not_a_module_either import x
+"""
+import os, sys as system
+import xml.etree.ElementTree as ET; import json
+import email . mime
+from . import sibling
+from .relative_pkg import thing
+from ..parent.child import other
+from.nospace import y
+from .import tight
+from collections import (
+    OrderedDict,  # import fake_in_parenthesized_comment
+    defaultdict,
+)
+from \
+    continued_module import z
+import first_continued, \
+    second_continued
+
+text = "import fake_in_string"
+raw = r'from fake_raw import x'
+escaped = 'it\'s \
+import fake_continued_string'
+data = b"import fake_bytes"
+multi = f"""
+import fake_in_fstring {os.sep}
+"""
+# import fake_in_comment
+dynamic = __import__("fake_dynamic")
+importlib_name = "importlib"
+if"import"in text: pass
+
+
+def gen():
+    yield from range(3)
+
+
+def fail():
+    try:
+        import inner_module
+    except ImportError as error:
+        raise RuntimeError("from fake import x") from error
+
+
+class Lazy:
+    def load(self):
+        if True: import conditional_module
+        from inner_package.sub import name  # noqa
+        return name
+
+
+while False:
+    import loop_module
+else:
+    pass
+
+with open(__file__) as f: import with_module
@@ -0,0 +1,67 @@
+"""
+bench_ast_visitor
+----------------------------------
+
+Compare ``ast.walk`` with ``pipreqs.collect_imports`` on a large generated
+module of SQLAlchemy-style models.
+
+Usage: python -m tests.benchmarks.bench_ast_visitor [<lines>]
+"""
+
+import ast
+import sys
+import timeit
+
+from pipreqs import pipreqs
+
+MODEL_TEMPLATE = '''
+
+class Model{index}(Base):
+    __tablename__ = "model_{index}"
+    __table_args__ = (UniqueConstraint("name", "owner_id"), {{"schema": "public"}})
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255), nullable=False, default="model-{index}")
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    tags = relationship("Tag", secondary=tags_table, backref=backref("model_{index}", lazy="dynamic"))
+'''
+
+
+def generate_models(lines):
+    parts = [
+        "from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, UniqueConstraint, func\n",
+        "from sqlalchemy.orm import backref, relationship\n",
+    ]
+    index = 0
+    while sum(part.count("\n") for part in parts) < lines:
+        parts.append(MODEL_TEMPLATE.format(index=index))
+        index += 1
+    return "".join(parts)
+
+
+def walk_imports(tree):
+    raw_imports = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for subnode in node.names:
+                raw_imports.add(subnode.name)
+        elif isinstance(node, ast.ImportFrom):
+            raw_imports.add(node.module)
+    return raw_imports
+
+
+def main(lines=40000, repeat=5):
+    tree = ast.parse(generate_models(lines))
+    assert walk_imports(tree) == pipreqs.collect_imports(tree)
+
+    walk_time = min(timeit.repeat(lambda: walk_imports(tree), number=1, repeat=repeat))
+    pruned_time = min(timeit.repeat(lambda: pipreqs.collect_imports(tree), number=1, repeat=repeat))
+    print("lines:           {}".format(lines))
+    print("ast.walk:        {:.4f}s".format(walk_time))
+    print("collect_imports: {:.4f}s".format(pruned_time))
+    print("speedup:         {:.1f}x".format(walk_time / pruned_time))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
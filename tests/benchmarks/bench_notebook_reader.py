@@ -0,0 +1,82 @@
+"""
+bench_notebook_reader
+----------------------------------
+
+Read the code cells of a large generated notebook, whose outputs are
+mostly base64 encoded images, and report the time taken and the peak
+memory used by ``pipreqs.notebook_to_python`` and by ``json.load``.
+
+Usage: python -m tests.benchmarks.bench_notebook_reader [<megabytes>]
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from pipreqs import pipreqs
+
+CODE_CELL = {
+    "cell_type": "code",
+    "execution_count": 1,
+    "metadata": {},
+    "source": ["%matplotlib inline\n", "import numpy as np\n", "import matplotlib.pyplot as plt\n"],
+}
+IMAGE_SIZE = 4 * 1024 * 1024
+
+
+def write_notebook(file_name, megabytes):
+    """Write a notebook of about *megabytes*, one image output per cell."""
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+    image = "".join(random.choice(alphabet) for _ in range(IMAGE_SIZE))
+    cells = max(1, megabytes * 1024 * 1024 // IMAGE_SIZE)
+    with open(file_name, "w") as f:
+        f.write('{"cells": [')
+        for index in range(cells):
+            cell = dict(CODE_CELL, outputs=[{"output_type": "display_data", "metadata": {}, "data": {}}])
+            head, tail = json.dumps(cell).rsplit("{}}]", 1)
+            f.write(", " if index else "")
+            f.write(head)
+            f.write('{"image/png": "')
+            f.write(image)
+            f.write('"}}]')
+            f.write(tail)
+        f.write('], "metadata": {}, "nbformat": 4, "nbformat_minor": 5}')
+    return cells
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def load_with_json(file_name):
+    with open(file_name) as f:
+        return json.load(f)
+
+
+def main(megabytes=500):
+    with tempfile.TemporaryDirectory() as tmp:
+        file_name = os.path.join(tmp, "large.ipynb")
+        cells = write_notebook(file_name, megabytes)
+        size = os.path.getsize(file_name)
+
+        source, reader_time, reader_peak = measure(pipreqs.notebook_to_python, file_name)
+        assert pipreqs.imports_from_source(source) == {"numpy", "matplotlib.pyplot"}
+        _, json_time, json_peak = measure(load_with_json, file_name)
+
+    print("notebook:           {:.0f} MB, {} cells".format(size / 2 ** 20, cells))
+    print("notebook_to_python: {:.2f}s, peak {:.1f} MB".format(reader_time, reader_peak / 2 ** 20))
+    print("json.load:          {:.2f}s, peak {:.1f} MB".format(json_time, json_peak / 2 ** 20))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
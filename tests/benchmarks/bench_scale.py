@@ -0,0 +1,354 @@
+"""
+bench_scale
+----------------------------------
+
+Generate a synthetic project and report the wall time, the files per
+second and the peak memory of each phase of a pipreqs run: walking the
+tree, parsing the files, resolving the imports with the local environment
+and resolving the rest on a PyPI server. The PyPI server is a local fake,
+so that the remote phase measures pipreqs and not the network.
+
+The projects are generated from a seed, so the same arguments give the
+same tree on every commit. The results are written as JSON; pass the
+results of an earlier run with ``--compare`` to print the ratio of each
+measure.
+
+Usage: python -m tests.benchmarks.bench_scale [--files=<n>] [--output=<file>] [--compare=<file>] ...
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pipreqs import pipreqs
+
+SIZES = {"1k": 1000, "10k": 10000, "100k": 100000, "500k": 500000}
+STDLIB_MODULES = ["os", "sys", "json", "re", "collections", "itertools", "functools", "logging", "typing", "pathlib"]
+INSTALLED_MODULES = ["docopt", "yarg"]
+FILLER_LINES = [
+    "def function_{index}(value, *args, **kwargs):",
+    "    result = [item * {index} for item in range(value) if item % 3]",
+    "    return {{'value': value, 'result': result, 'index': {index}}}",
+    "",
+    "class Model{index}(object):",
+    "    name = 'model-{index}'",
+    "",
+]
+
+
+def generate_project(
+    path,
+    files=1000,
+    notebook_share=0.05,
+    max_depth=6,
+    files_per_dir=20,
+    import_density=8,
+    mean_lines=120,
+    packages=300,
+    seed=0,
+):
+    """Write a synthetic project of *files* files under *path*.
+
+    Args:
+        path (str): Directory of the project, created if needed.
+        files (int): Number of files to write.
+        notebook_share (float): Share of the files that are notebooks.
+        max_depth (int): Maximum nesting depth of the directories.
+        files_per_dir (int): Average number of files in a directory.
+        import_density (int): Average number of import statements of a
+            file.
+        mean_lines (int): Average number of lines of a file; the sizes
+            follow a log-normal distribution.
+        packages (int): Number of distinct third party packages imported
+            across the project.
+        seed (int): Seed of the generator.
+
+    Returns:
+        dict: The parameters and the number of files, notebooks,
+            directories and bytes written.
+
+    """
+    rng = random.Random(seed)
+    third_party = INSTALLED_MODULES + ["synthpkg_{}".format(index) for index in range(packages)]
+    directories = [path]
+    os.makedirs(path, exist_ok=True)
+    modules = []
+    stats = {"files": 0, "notebooks": 0, "directories": 1, "bytes": 0}
+
+    for index in range(files):
+        if rng.random() * files_per_dir < 1:
+            parent = rng.choice(directories)
+            if os.path.relpath(parent, path).count(os.sep) + 1 < max_depth:
+                directory = os.path.join(parent, "pkg_{}".format(len(directories)))
+                os.makedirs(directory)
+                directories.append(directory)
+                stats["directories"] += 1
+        directory = directories[-1] if rng.random() < 0.7 else rng.choice(directories)
+
+        imports = []
+        for _ in range(max(0, int(rng.gauss(import_density, import_density / 3)))):
+            kind = rng.random()
+            if kind < 0.4:
+                name = rng.choice(STDLIB_MODULES)
+            elif kind < 0.6 and modules:
+                name = rng.choice(modules)
+            else:
+                # A few packages are imported everywhere, most rarely
+                name = third_party[min(int(rng.paretovariate(1.2)) - 1, len(third_party) - 1)]
+            if rng.random() < 0.5:
+                imports.append("import {}".format(name))
+            else:
+                imports.append("from {}.sub import thing_{}".format(name, index))
+        lines = imports + [
+            line.format(index=index)
+            for _ in range(max(1, int(rng.lognormvariate(0, 0.8) * mean_lines) // len(FILLER_LINES)))
+            for line in FILLER_LINES
+        ]
+
+        if rng.random() < notebook_share:
+            file_name = os.path.join(directory, "notebook_{}.ipynb".format(index))
+            contents = json.dumps(_notebook(lines, rng))
+            stats["notebooks"] += 1
+        else:
+            module = "module_{}".format(index)
+            file_name = os.path.join(directory, module + ".py")
+            contents = "\n".join(lines) + "\n"
+            modules.append(module)
+        with open(file_name, "w") as f:
+            f.write(contents)
+        stats["files"] += 1
+        stats["bytes"] += len(contents)
+
+    return dict(
+        stats,
+        notebook_share=notebook_share,
+        max_depth=max_depth,
+        files_per_dir=files_per_dir,
+        import_density=import_density,
+        mean_lines=mean_lines,
+        packages=packages,
+        seed=seed,
+    )
+
+
+def _notebook(lines, rng):
+    cells = []
+    for start in range(0, len(lines), 10):
+        cells.append(
+            {
+                "cell_type": "code",
+                "execution_count": len(cells) + 1,
+                "metadata": {},
+                "outputs": [{"output_type": "stream", "name": "stdout", "text": ["x" * rng.randint(0, 2000)]}],
+                "source": [line + "\n" for line in lines[start:start + 10]],
+            }
+        )
+    return {"cells": cells, "metadata": {}, "nbformat": 4, "nbformat_minor": 5}
+
+
+class FakePyPI:
+    """A local PyPI JSON API knowing every package, at version 1.0."""
+
+    def __init__(self):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                name = self.path.strip("/").split("/")[-2]
+                body = json.dumps(
+                    {
+                        "info": {"name": name, "version": "1.0", "package_url": "https://pypi.org/project/" + name},
+                        "releases": {"1.0": []},
+                    }
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = "http://127.0.0.1:{}/pypi/".format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def measure(function, *args, trace_memory=True):
+    """Call *function* and return its result, wall time, CPU time and peak memory."""
+    if trace_memory:
+        tracemalloc.start()
+    start, start_cpu = time.perf_counter(), time.process_time()
+    result = function(*args)
+    elapsed, cpu = time.perf_counter() - start, time.process_time() - start_cpu
+    peak = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, cpu, peak
+
+
+def run(path, scanner, pypi_server, trace_memory=True):
+    """Run each phase of pipreqs on the project at *path* and return their measures."""
+    local_names = set()
+    phases = {}
+
+    def record(phase, items, elapsed, cpu, peak):
+        phases[phase] = {
+            "items": items,
+            "wall_time": round(elapsed, 4),
+            "cpu_time": round(cpu, 4),
+            "items_per_second": round(items / elapsed, 1) if elapsed else None,
+            "peak_memory": peak,
+        }
+
+    file_names, *measures = measure(lambda: list(scanner.walk(path, local_names)), trace_memory=trace_memory)
+    record("walk", len(file_names), *measures)
+
+    def parse():
+        imports = set()
+        for _, raw_imports in scanner._parse_files(file_names):
+            imports.update(name.partition(".")[0] for name in raw_imports if name)
+        return sorted(imports - local_names - scanner.stdlib)
+
+    imports, *measures = measure(parse, trace_memory=trace_memory)
+    record("parse", len(file_names), *measures)
+
+    def resolve_local():
+        resolver = pipreqs.Resolver(pypi_server=pypi_server)
+        candidates = pipreqs.get_pkg_names(imports)
+        local = pipreqs.get_import_local(candidates, index=resolver.local_index)
+        found = pipreqs.LocalPackageIndex(local)
+        return resolver, local, [name for name in candidates if not found.provides(name)]
+
+    (resolver, local, missing), *measures = measure(resolve_local, trace_memory=trace_memory)
+    record("local_resolve", len(imports), *measures)
+
+    remote, *measures = measure(resolver._resolve_remote, missing, trace_memory=trace_memory)
+    record("remote_resolve", len(missing), *measures)
+    resolver.close()
+
+    return phases, {"imports": len(imports), "local": len(local), "missing": len(missing), "remote": len(remote)}
+
+
+def compare(results, baseline):
+    """Print the ratio of each measure of *results* to those of *baseline*."""
+    print("{:<16}{:>12}{:>12}{:>12}".format("phase", "wall time", "files/s", "peak memory"))
+    for phase, current in results["phases"].items():
+        previous = baseline["phases"].get(phase)
+        if not previous:
+            continue
+        ratios = []
+        for key in ["wall_time", "items_per_second", "peak_memory"]:
+            if current[key] and previous[key]:
+                ratios.append("{:.2f}x".format(current[key] / previous[key]))
+            else:
+                ratios.append("-")
+        print("{:<16}{:>12}{:>12}{:>12}".format(phase, *ratios))
+
+
+def _git_commit():
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return None
+    return output.stdout.strip() or None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--files", default="1k", help="number of files, or one of " + ", ".join(SIZES))
+    parser.add_argument("--notebook-share", type=float, default=0.05)
+    parser.add_argument("--max-depth", type=int, default=6)
+    parser.add_argument("--files-per-dir", type=int, default=20)
+    parser.add_argument("--import-density", type=int, default=8)
+    parser.add_argument("--mean-lines", type=int, default=120)
+    parser.add_argument("--packages", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=None, help="parse in this many processes, as pipreqs --jobs")
+    parser.add_argument("--parser", default="ast", choices=["ast", "tokens"])
+    parser.add_argument("--no-memory", action="store_true", help="do not trace memory, which slows the phases down")
+    parser.add_argument("--project", help="reuse or create the project in this directory instead of a temporary one")
+    parser.add_argument("--output", help="write the results to this JSON file instead of stdout")
+    parser.add_argument("--compare", help="print the ratios to the results of this JSON file")
+    args = parser.parse_args(argv)
+    files = SIZES.get(args.files) or int(args.files)
+
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.project or os.path.join(tmp, "project")
+        parameters = dict(
+            files=files,
+            notebook_share=args.notebook_share,
+            max_depth=args.max_depth,
+            files_per_dir=args.files_per_dir,
+            import_density=args.import_density,
+            mean_lines=args.mean_lines,
+            packages=args.packages,
+            seed=args.seed,
+        )
+        project_file = os.path.join(path, "project.json")
+        project = None
+        if args.project and os.path.exists(project_file):
+            with open(project_file) as f:
+                project = json.load(f)
+            if any(project[key] != value for key, value in parameters.items()):
+                sys.exit("{} was generated with other parameters".format(path))
+        if project is None:
+            start = time.perf_counter()
+            project = generate_project(path, **parameters)
+            project["generation_time"] = round(time.perf_counter() - start, 2)
+            with open(project_file, "w") as f:
+                json.dump(project, f)
+
+        scanner = pipreqs.Scanner(scan_notebooks=args.notebook_share > 0, jobs=args.jobs, parser=args.parser)
+        with FakePyPI() as pypi:
+            phases, counts = run(path, scanner, pypi.url, trace_memory=not args.no_memory)
+
+    results = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {"jobs": args.jobs, "parser": args.parser, "trace_memory": not args.no_memory},
+        "project": project,
+        "counts": counts,
+        "phases": phases,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -13,12 +13,22 @@ import logging
 from unittest.mock import patch, Mock
 import unittest
 import os
+import json
+import platform
 import requests
+import shutil
+import subprocess
 import sys
+import tempfile
+import threading
+import time
 import warnings
 
 from pipreqs import pipreqs
 
+# Budget for ``import pipreqs.pipreqs``, in microseconds of cumulative import time
+STARTUP_BUDGET_US = 100000
+
 
 class TestPipreqs(unittest.TestCase):
 
@@ -48,7 +58,8 @@ class TestPipreqs(unittest.TestCase):
             "after_method_is_valid_even_if_not_pep8",
         ]
         cls.modules2 = ["beautifulsoup4"]
-        cls.local = ["docopt", "requests", "nose", "pyflakes", "ipython"]
+        # beautifulsoup4 is installed along with nbconvert
+        cls.local = ["docopt", "requests", "nose", "pyflakes", "ipython", "beautifulsoup4"]
         cls.project = os.path.join(os.path.dirname(__file__), "_data")
         cls.empty_filepath = os.path.join(cls.project, "empty.txt")
         cls.imports_filepath = os.path.join(cls.project, "imports.txt")
@@ -89,6 +100,7 @@ class TestPipreqs(unittest.TestCase):
 
         cls.python_path_same_imports = os.path.join(os.path.dirname(__file__), "_data/test.py")
         cls.notebook_path_same_imports = os.path.join(os.path.dirname(__file__), "_data_notebook/test.ipynb")
+        cls.corner_cases_path = os.path.join(os.path.dirname(__file__), "_data_tokens", "corner_cases.py")
 
     def test_get_all_imports(self):
         imports = pipreqs.get_all_imports(self.project)
@@ -102,6 +114,392 @@ class TestPipreqs(unittest.TestCase):
         self.assertFalse("django" in imports)
         self.assertFalse("models" in imports)
 
+    def test_get_all_imports_parallel(self):
+        """
+        Test that parsing files in worker processes finds the same imports
+        """
+        serial_imports = pipreqs.get_all_imports(self.project)
+        parallel_imports = pipreqs.get_all_imports(self.project, jobs=2)
+        self.assertEqual(sorted(serial_imports), sorted(parallel_imports))
+
+    def test_iter_imports(self):
+        """
+        Test that iter_imports() yields the imports of each file and collects the local names
+        """
+        with tempfile.TemporaryDirectory() as project:
+            os.mkdir(os.path.join(project, "pkg"))
+            app = os.path.join(project, "app.py")
+            models = os.path.join(project, "pkg", "models.py")
+            with open(app, "w") as f:
+                f.write("import flask\nfrom os import path\nfrom . import views\n")
+            with open(models, "w") as f:
+                f.write("import sqlalchemy.orm\nimport app\n")
+
+            for jobs in [None, 2]:
+                local_names = set()
+                imports = pipreqs.iter_imports(project, jobs=jobs, local_names=local_names)
+                self.assertEqual(
+                    sorted(imports),
+                    [(app, "flask"), (app, "os"), (models, "app"), (models, "sqlalchemy.orm")],
+                )
+                self.assertEqual(local_names, {os.path.basename(project), "pkg", "app", "models"})
+
+            # A single file
+            local_names = set()
+            self.assertEqual(
+                sorted(pipreqs.iter_imports(models, local_names=local_names)),
+                [(models, "app"), (models, "sqlalchemy.orm")],
+            )
+            self.assertEqual(local_names, {"models"})
+            readme = os.path.join(project, "README.md")
+            with open(readme, "w") as f:
+                f.write("import flask\n")
+            self.assertEqual(list(pipreqs.iter_imports(readme)), [])
+
+    def test_iter_imports_stop_early(self):
+        """
+        Test that the imports parsed before the caller stops are saved to the cache
+        """
+        with tempfile.TemporaryDirectory() as cache_dir:
+            imports = pipreqs.iter_imports(self.project, cache_dir=cache_dir)
+            file_name, _ = next(imports)
+            imports.close()
+            cache = pipreqs.ParseCache(cache_dir, self.project)
+        self.assertEqual(list(cache.entries), [os.path.abspath(file_name)])
+
+    def test_git_walk(self):
+        """
+        Test that the git mode only scans tracked and unignored untracked files
+        """
+        with tempfile.TemporaryDirectory() as project:
+            files = {
+                "app.py": "import flask\n",
+                "pkg/models.py": "import sqlalchemy\n",
+                "pkg/deleted.py": "import deleted\n",
+                "scripts/untracked.py": "import requests\n",
+                "build/lib/app.py": "import built\n",
+                "node_modules/lib/binding.py": "import gyp\n",
+                ".gitignore": "build/\nnode_modules/\n",
+            }
+            for name, contents in files.items():
+                os.makedirs(os.path.join(project, os.path.dirname(name)), exist_ok=True)
+                with open(os.path.join(project, name), "w") as f:
+                    f.write(contents)
+            subprocess.run(["git", "init", "-q"], cwd=project, check=True)
+            subprocess.run(["git", "add", "app.py", "pkg", ".gitignore"], cwd=project, check=True)
+            os.remove(os.path.join(project, "pkg", "deleted.py"))
+
+            scanner = pipreqs.Scanner(use_git=True)
+            local_names = set()
+            self.assertEqual(
+                sorted(scanner.walk(project, local_names)),
+                [os.path.join(project, name) for name in ["app.py", "pkg/models.py", "scripts/untracked.py"]],
+            )
+            self.assertEqual(local_names, {os.path.basename(project), "app", "pkg", "models", "scripts", "untracked"})
+            self.assertEqual(sorted(scanner.get_all_imports(project)), ["flask", "requests", "sqlalchemy"])
+
+            # Outside of a git repository, the directory is walked
+            shutil.rmtree(os.path.join(project, ".git"))
+            self.assertEqual(
+                sorted(scanner.get_all_imports(project)), ["built", "flask", "gyp", "requests", "sqlalchemy"]
+            )
+
+    def test_ignore_patterns(self):
+        """
+        Test the gitignore-style matching of IgnorePatterns
+        """
+        patterns = pipreqs.IgnorePatterns(
+            [
+                "# comment",
+                "",
+                "services/*/fixtures",
+                "**/generated/**",
+                "build/",
+                "/scripts",
+                "*_pb2.py",
+                "!keep_pb2.py",
+                "tests/**/data?",
+                "[ab]tmp",
+            ]
+        )
+        cases = [
+            ("services/api/fixtures", True, True),
+            ("services/api/v1/fixtures", True, False),
+            ("fixtures", True, False),
+            ("src/generated/models.py", False, True),
+            ("generated/models.py", False, True),
+            ("generated", True, False),
+            ("build", True, True),
+            ("src/build", True, True),
+            ("build", False, False),
+            ("scripts", True, True),
+            ("src/scripts", True, False),
+            ("api_pb2.py", False, True),
+            ("src/api_pb2.py", False, True),
+            ("src/keep_pb2.py", False, False),
+            ("tests/data1", True, True),
+            ("tests/unit/io/data2", True, True),
+            ("atmp", True, True),
+            ("ctmp", True, False),
+        ]
+        for path, is_dir, ignored in cases:
+            self.assertEqual(patterns.match(path, is_dir), ignored, path)
+
+    def test_ignore_patterns_walk(self):
+        """
+        Test that --ignore and .pipreqsignore patterns prune the walk
+        """
+        with tempfile.TemporaryDirectory() as project:
+            for name in [
+                "app.py",
+                "api_pb2.py",
+                "services/api/fixtures/data.py",
+                "services/api/handlers.py",
+                "tools/fixtures/load.py",
+                "src/generated/models.py",
+            ]:
+                os.makedirs(os.path.join(project, os.path.dirname(name)), exist_ok=True)
+                open(os.path.join(project, name), "w").close()
+            with open(os.path.join(project, ".pipreqsignore"), "w") as f:
+                f.write("**/generated/**\n*_pb2.py\n")
+
+            scanner = pipreqs.Scanner(extra_ignore_dirs=["services/*/fixtures"])
+            directories = set()
+            files = sorted(os.path.relpath(f, project) for f in scanner.walk(project, directories=directories))
+            self.assertEqual(
+                files,
+                [
+                    os.path.join(*name.split("/"))
+                    for name in ["app.py", "services/api/handlers.py", "tools/fixtures/load.py"]
+                ],
+            )
+            self.assertNotIn(os.path.join(project, "services", "api", "fixtures"), directories)
+
+    def test_ignore_paths_relative_to_cwd(self):
+        """
+        Test that --ignore paths relative to the working directory are
+        resolved against the project
+        """
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, contents in [("proj/app.py", "import flask\n"), ("proj/tests/test_app.py", "import pytest\n")]:
+                os.makedirs(os.path.join(tmp, os.path.dirname(name)), exist_ok=True)
+                with open(os.path.join(tmp, name), "w") as f:
+                    f.write(contents)
+            os.chdir(tmp)
+            try:
+                for ignored in ["proj/tests", "./proj/tests", "proj/tests/", os.path.join(tmp, "proj", "tests")]:
+                    with self.subTest(ignored=ignored):
+                        self.assertEqual(pipreqs.get_all_imports("proj", extra_ignore_dirs=[ignored]), ["flask"])
+                # Patterns relative to the project keep their meaning
+                self.assertEqual(pipreqs.get_all_imports("proj", extra_ignore_dirs=["/tests"]), ["flask"])
+                imports = pipreqs.get_all_imports("proj", extra_ignore_dirs=["proj/*"])
+                self.assertEqual(sorted(imports), ["flask", "pytest"])
+            finally:
+                os.chdir(cwd)
+
+    def test_make_batches(self):
+        """
+        Test that every file is scheduled exactly once, largest files first
+        """
+        file_names = [
+            os.path.join(self.project, name) for name in ["test.py", "models.py", "imports.txt", "empty.txt"]
+        ]
+        batches = pipreqs._make_batches(file_names, 2)
+        scheduled = [f for batch in batches for f in batch]
+        self.assertEqual(sorted(scheduled), sorted(file_names))
+        sizes = [os.path.getsize(f) for f in scheduled]
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+
+    def test_parse_cache(self):
+        """
+        Test that a second run reuses the imports of unchanged files
+        without writing the cache again
+        """
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with patch.object(pipreqs, "imports_from_source", wraps=pipreqs.imports_from_source) as parse_mock:
+                imports = pipreqs.get_all_imports(self.project, cache_dir=cache_dir)
+            self.assertGreater(parse_mock.call_count, 0)
+            self.assertTrue(os.path.exists(pipreqs.ParseCache(cache_dir, self.project).path))
+
+            with patch.object(pipreqs, "imports_from_source", wraps=pipreqs.imports_from_source) as parse_mock:
+                with patch.object(pipreqs, "_write_json_atomic") as write_mock:
+                    cached_imports = pipreqs.get_all_imports(self.project, cache_dir=cache_dir)
+            parse_mock.assert_not_called()
+            write_mock.assert_not_called()
+            self.assertEqual(sorted(imports), sorted(cached_imports))
+
+    def test_parse_cache_per_project(self):
+        """
+        Test that each project has its own cache file
+        """
+        with tempfile.TemporaryDirectory() as cache_dir:
+            pipreqs.get_all_imports(self.project, cache_dir=cache_dir)
+            pipreqs.get_all_imports(self.project_with_notebooks, cache_dir=cache_dir)
+            cache = pipreqs.ParseCache(cache_dir, self.project)
+            other = pipreqs.ParseCache(cache_dir, self.project_with_notebooks)
+            self.assertNotEqual(cache.path, other.path)
+            self.assertTrue(cache.entries)
+            self.assertTrue(other.entries)
+            self.assertFalse(cache.entries.keys() & other.entries.keys())
+            self.assertEqual(pipreqs.ParseCache(cache_dir, self.project + os.sep).path, cache.path)
+
+    def test_parse_cache_detects_changes(self):
+        """
+        Test that a modified file is parsed again, even if its size is unchanged
+        """
+        with tempfile.TemporaryDirectory() as project, tempfile.TemporaryDirectory() as cache_dir:
+            file_name = os.path.join(project, "app.py")
+            with open(file_name, "w") as f:
+                f.write("import flask\n")
+            self.assertEqual(pipreqs.get_all_imports(project, cache_dir=cache_dir), ["flask"])
+
+            with open(file_name, "w") as f:
+                f.write("import numpy\n")
+            self.assertEqual(pipreqs.get_all_imports(project, cache_dir=cache_dir), ["numpy"])
+
+    def test_parse_cache_keeps_nbconvert_apart(self):
+        """
+        Test that notebooks read by the built-in extractor are converted
+        again by nbconvert, and that the nbconvert results are reused
+        """
+        with tempfile.TemporaryDirectory() as cache_dir:
+            pipreqs.Scanner(scan_notebooks=True, cache_dir=cache_dir).get_all_imports(self.project_with_notebooks)
+            nbconvert_scanner = pipreqs.Scanner(scan_notebooks=True, nbconvert=True, cache_dir=cache_dir, jobs=1)
+            with patch.object(pipreqs, "ipynb_2_py", wraps=pipreqs.ipynb_2_py) as convert:
+                nbconvert_scanner.get_all_imports(self.project_with_notebooks)
+            self.assertGreater(convert.call_count, 0)
+
+            tokens_scanner = pipreqs.Scanner(
+                scan_notebooks=True, nbconvert=True, cache_dir=cache_dir, jobs=1, parser="tokens"
+            )
+            with patch.object(pipreqs, "ipynb_2_py", wraps=pipreqs.ipynb_2_py) as convert:
+                tokens_scanner.get_all_imports(self.project_with_notebooks)
+            convert.assert_not_called()
+
+    def test_parse_cache_eviction_and_version(self):
+        """
+        Test that the least recently used entries are evicted and that
+        caches written by another version are discarded
+        """
+        models_path = os.path.join(self.project, "models.py")
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = pipreqs.ParseCache(cache_dir, max_entries=1)
+            cache.store(self.python_path_same_imports, {"flask"})
+            cache.store(models_path, {"peewee"})
+            cache.save()
+
+            cache = pipreqs.ParseCache(cache_dir)
+            self.assertIsNone(cache.lookup(self.python_path_same_imports))
+            self.assertEqual(cache.lookup(models_path), {"peewee"})
+
+            with open(cache.path, "w") as f:
+                json.dump({"version": pipreqs.PARSE_CACHE_VERSION - 1, "entries": cache.entries}, f)
+            self.assertEqual(pipreqs.ParseCache(cache_dir).entries, {})
+
+    def test_parse_cache_save(self):
+        """
+        Test that saving merges the entries of other runs, and only loads
+        the cache file again when another run saved it
+        """
+        models_path = os.path.join(self.project, "models.py")
+        with tempfile.TemporaryDirectory() as cache_dir:
+            first, second = pipreqs.ParseCache(cache_dir), pipreqs.ParseCache(cache_dir)
+            first.store(self.python_path_same_imports, {"flask"})
+            second.store(models_path, {"peewee"})
+            with patch.object(pipreqs.ParseCache, "_load", autospec=True, side_effect=pipreqs.ParseCache._load) as load:
+                first.save()
+                load.assert_not_called()
+                second.save()
+                load.assert_called_once()
+
+            cache = pipreqs.ParseCache(cache_dir)
+            self.assertEqual(cache.lookup(self.python_path_same_imports), {"flask"})
+            self.assertEqual(cache.lookup(models_path), {"peewee"})
+            name, = cache.entries[os.path.abspath(models_path)]["imports"]
+            self.assertIs(name, sys.intern("peewee"))
+
+    def test_collect_imports(self):
+        """
+        Test that the pruned visitor finds the imports of every statement body
+        """
+        source = "\n".join(
+            [
+                "import a",
+                "def f():",
+                "    try:",
+                "        import b",
+                "    except ImportError:",
+                "        from c import x",
+                "    else:",
+                "        import d",
+                "    finally:",
+                "        import e",
+                "class C:",
+                "    for _ in []:",
+                "        import f",
+                "    else:",
+                "        import g",
+                "    with open('x'):",
+                "        while True:",
+                "            if True:",
+                "                import h",
+                "            elif False:",
+                "                import i",
+            ]
+        )
+        if sys.version_info >= (3, 10):
+            source += "\nmatch x:\n    case 1:\n        import j\n"
+        tree = pipreqs.ast.parse(source)
+        expected_imports = {
+            node.module if isinstance(node, pipreqs.ast.ImportFrom) else node.names[0].name
+            for node in pipreqs.ast.walk(tree)
+            if isinstance(node, (pipreqs.ast.Import, pipreqs.ast.ImportFrom))
+        }
+        self.assertEqual(pipreqs.collect_imports(tree), expected_imports)
+
+    def test_token_parser(self):
+        """
+        Test that the token scanner finds the same imports as the ast parser
+        """
+        tests_dir = os.path.dirname(__file__)
+        file_names = [
+            os.path.join(root, name)
+            for data_dir in os.listdir(tests_dir)
+            if data_dir.startswith("_data")
+            for root, _, names in os.walk(os.path.join(tests_dir, data_dir))
+            for name in names
+            if name.endswith((".py", ".pyw"))
+        ]
+        self.assertIn(self.corner_cases_path, file_names)
+        for file_name in file_names:
+            with self.subTest(file_name):
+                for read_mode in ["r", "rb"]:
+                    with open(file_name, read_mode) as f:
+                        contents = f.read()
+                    self.assertIsNotNone(pipreqs._scan_import_tokens(contents))
+                    self.assertEqual(
+                        pipreqs.imports_from_source(contents, "tokens"),
+                        pipreqs.imports_from_source(contents, "ast"),
+                    )
+
+    def test_token_parser_falls_back_to_ast(self):
+        """
+        Test that sources the token scanner cannot classify are parsed
+        """
+        ambiguous_sources = [
+            'x = f"{d["key"]}"\nimport os\n',  # quote reuse in f-strings (Python 3.12+)
+            "x = 'unterminated\nimport os\n",
+            "x = import os\n",
+            "import boto as b, import peewee as p,\n",
+            "from os\nimport sys\n",
+        ]
+        for source in ambiguous_sources:
+            with self.subTest(source):
+                self.assertIsNone(pipreqs._scan_import_tokens(source))
+        self.assertEqual(pipreqs._scan_import_tokens("x = 1\n"), set())
+        self.assertRaises(SyntaxError, pipreqs.get_all_imports, self.project_invalid, parser="tokens")
+
     def test_deduplicate_dependencies(self):
         imports = pipreqs.get_all_imports(self.project_with_duplicated_deps)
         pkgs = pipreqs.get_pkg_names(imports)
@@ -121,6 +519,67 @@ class TestPipreqs(unittest.TestCase):
         imports = pipreqs.get_all_imports(self.project_invalid, ignore_errors=True)
         self.assertEqual(len(imports), 0)
 
+    def test_source_encodings(self):
+        """
+        Test that python files are parsed in the encoding they declare, and
+        that files invalid in it are decoded with the --encoding fallback
+        """
+        sources = {
+            "latin1_cookie.py": b"# -*- coding: latin-1 -*-\nimport numpy\ns = '\xe9'\n",
+            "latin1_second_line.py": b"#!/usr/bin/env python\n# vim: set fileencoding=latin-1 :\nimport boto\n",
+            "latin1_undeclared.py": b"import flask\ns = '\xe9'\n",
+            "bom.py": b"\xef\xbb\xbfimport requests\n",
+            "shift_jis.py": "# coding: shift_jis\nimport yaml\ns = '表'\nimport pandas\n".encode("shift_jis"),
+            "unknown_cookie.py": b"# coding: klingon\nimport scipy\n",
+        }
+        expected = {
+            "latin1_cookie.py": {"numpy"},
+            "latin1_second_line.py": {"boto"},
+            "latin1_undeclared.py": {"flask"},
+            "bom.py": {"requests"},
+            "shift_jis.py": {"yaml", "pandas"},
+            "unknown_cookie.py": {"scipy"},
+        }
+        with tempfile.TemporaryDirectory() as project:
+            for name, contents in sources.items():
+                with open(os.path.join(project, name), "wb") as f:
+                    f.write(contents)
+            file_names = sorted(os.path.join(project, name) for name in sources)
+            for parser in ["ast", "tokens"]:
+                with self.subTest(parser=parser):
+                    parsed = pipreqs.Scanner(encoding="latin-1", parser=parser).parse_imports(file_names)
+                    self.assertEqual({os.path.basename(name): imports for name, imports in parsed.items()}, expected)
+
+        self.assertEqual(pipreqs._coding_cookie(sources["latin1_second_line.py"]), "latin-1")
+        self.assertIsNone(pipreqs._coding_cookie(b"import os\n# coding: latin-1\n"))
+
+    def test_source_mmap(self):
+        """
+        Test that files above MMAP_THRESHOLD are memory-mapped and parsed in place
+        """
+        with tempfile.TemporaryDirectory() as project:
+            file_name = os.path.join(project, "large.py")
+            with open(file_name, "wb") as f:
+                f.write(b"import django\n" + b"x = 'import nothing'\n" * 100 + b"from celery import Celery\n")
+            scanner = pipreqs.Scanner(parser="tokens")
+            with patch.object(pipreqs, "MMAP_THRESHOLD", 1024):
+                with scanner.source(file_name) as contents:
+                    self.assertEqual(type(contents).__name__, "mmap")
+                    self.assertEqual(pipreqs._scan_import_tokens(contents), {"django", "celery"})
+                self.assertTrue(contents.closed)
+                for parser in ["ast", "tokens"]:
+                    imports = pipreqs.Scanner(parser=parser).parse_imports([file_name])
+                    self.assertEqual(imports, {file_name: {"django", "celery"}})
+            with scanner.source(file_name) as contents:
+                self.assertIsInstance(contents, bytes)
+
+    def test_invalid_python_parallel(self):
+        """
+        Test that errors raised in worker processes reach the caller.
+        """
+        file_names = [self.python_path_same_imports, os.path.join(self.project_invalid, "invalid.py")]
+        self.assertRaises(SyntaxError, pipreqs.parse_imports_parallel, file_names, 2)
+
     def test_get_imports_info(self):
         """
         Test to see that the right number of packages were found on PyPI
@@ -136,12 +595,140 @@ class TestPipreqs(unittest.TestCase):
                 "Import item appears to be missing " + item["name"],
             )
 
+    def test_get_imports_info_concurrently(self):
+        """
+        Test that imports are resolved concurrently, in a deterministic order
+        """
+        in_flight = []
+        max_in_flight = []
+        lock = threading.Lock()
+
+        def fake_get(session, url, **kwargs):
+            with lock:
+                in_flight.append(url)
+                max_in_flight.append(len(in_flight))
+            time.sleep(0.05)
+            with lock:
+                in_flight.remove(url)
+            name = url.rstrip("/").split("/")[-2]
+            if name == "missing":
+                return Mock(status_code=404, reason="Not Found")
+            payload = {"info": {"name": name, "version": "1.0." + name[-1], "package_url": url}, "releases": {}}
+            return Mock(status_code=200, content=json.dumps(payload).encode())
+
+        imports = ["pkg1", "missing", "pkg2", "pkg3", "pkg4"]
+        with patch.object(requests.Session, "get", autospec=True, side_effect=fake_get):
+            with_info = pipreqs.get_imports_info(imports, pypi_server="https://pypi.test/pypi/", concurrency=3)
+        self.assertEqual(
+            with_info,
+            [
+                {"name": "pkg1", "version": "1.0.1"},
+                {"name": "pkg2", "version": "1.0.2"},
+                {"name": "pkg3", "version": "1.0.3"},
+                {"name": "pkg4", "version": "1.0.4"},
+            ],
+        )
+        self.assertLessEqual(max(max_in_flight), 3)
+        self.assertGreater(max(max_in_flight), 1)
+
+    def test_get_imports_info_cache(self):
+        """
+        Test that PyPI lookups are cached, revalidated with their ETag and
+        available offline
+        """
+        requested_headers = []
+
+        def fake_get(session, url, headers=None, **kwargs):
+            requested_headers.append(headers)
+            if "missing" in url:
+                return Mock(status_code=404, reason="Not Found")
+            if headers and headers.get("If-None-Match") == '"v1"':
+                return Mock(status_code=304)
+            payload = {"info": {"name": "Flask", "version": "3.0.0", "package_url": url}, "releases": {}}
+            return Mock(status_code=200, content=json.dumps(payload).encode(), headers={"ETag": '"v1"'})
+
+        expected = [{"name": "flask", "version": "3.0.0"}]
+        with tempfile.TemporaryDirectory() as cache_dir, patch.object(
+            requests.Session, "get", autospec=True, side_effect=fake_get
+        ):
+            self.assertEqual(pipreqs.get_imports_info(["flask", "missing"], cache_dir=cache_dir), expected)
+            self.assertEqual(requested_headers, [{}, {}])
+
+            # Fresh entries, including missing packages, need no request
+            self.assertEqual(pipreqs.get_imports_info(["flask", "missing"], cache_dir=cache_dir), expected)
+            self.assertEqual(len(requested_headers), 2)
+
+            # Stale entries are revalidated
+            self.assertEqual(pipreqs.get_imports_info(["flask"], cache_dir=cache_dir, cache_ttl=0), expected)
+            self.assertEqual(requested_headers[-1], {"If-None-Match": '"v1"'})
+            self.assertEqual(pipreqs.get_imports_info(["flask"], cache_dir=cache_dir, refresh=True), expected)
+            self.assertEqual(len(requested_headers), 4)
+
+            # Offline runs only use the cache
+            offline_info = pipreqs.get_imports_info(["flask", "unknown"], cache_dir=cache_dir, offline=True)
+            self.assertEqual(offline_info, expected)
+            self.assertEqual(len(requested_headers), 4)
+
+    def test_package_index(self):
+        """
+        Test that imports are resolved from a package index built from
+        PyPI JSON documents
+        """
+        documents = {
+            "flask.json": {"info": {"name": "Flask", "version": "3.0.0"}, "releases": {}},
+            "nested/zope.interface.json": {"info": {"name": "zope.interface", "version": "6.1"}},
+            "not-pypi.json": {"name": "unrelated"},
+        }
+        with tempfile.TemporaryDirectory() as source:
+            for file_name, document in documents.items():
+                file_name = os.path.join(source, file_name)
+                os.makedirs(os.path.dirname(file_name), exist_ok=True)
+                with open(file_name, "w") as f:
+                    json.dump(document, f)
+            index_file = os.path.join(source, "index.sqlite")
+            pipreqs.init({"build-index": True, "<source>": source, "<index-file>": index_file})
+
+            with patch.object(requests.Session, "get") as get_mock:
+                with_info = pipreqs.get_imports_info_from_index(["flask", "unknown", "zope_interface"], index_file)
+            get_mock.assert_not_called()
+            self.assertEqual(
+                with_info,
+                [{"name": "flask", "version": "3.0.0"}, {"name": "zope_interface", "version": "6.1"}],
+            )
+
     def test_get_pkg_names(self):
         pkgs = ["jury", "Japan", "camel", "Caroline"]
         actual_output = pipreqs.get_pkg_names(pkgs)
         expected_output = ["camel", "Caroline", "Japan", "jury"]
         self.assertEqual(actual_output, expected_output)
 
+    def test_stdlib_and_mapping_are_loaded_once(self):
+        """
+        Test that the stdlib list and the mapping are read once, as read-only tables
+        """
+        self.assertIs(pipreqs.get_stdlib_modules(), pipreqs.get_stdlib_modules())
+        self.assertIsInstance(pipreqs.get_stdlib_modules(), frozenset)
+        self.assertIn("os", pipreqs.get_stdlib_modules())
+        self.assertIs(pipreqs.get_mapping(), pipreqs.get_mapping())
+        self.assertEqual(pipreqs.get_mapping()["bs4"], "beautifulsoup4")
+        with self.assertRaises(TypeError):
+            pipreqs.get_mapping()["bs4"] = "bs4"
+
+    def test_target_python(self):
+        """
+        Test that --target-python selects the standard library of one Python version
+        """
+        current = "{}.{}".format(*sys.version_info[:2])
+        if hasattr(sys, "stdlib_module_names"):
+            self.assertEqual(pipreqs.get_stdlib_modules(current), frozenset(sys.stdlib_module_names))
+        with patch.object(pipreqs.shutil, "which", return_value=None):
+            self.assertEqual(pipreqs.get_stdlib_modules("2.1"), pipreqs.get_stdlib_modules())
+        self.assertRaises(ValueError, pipreqs.get_stdlib_modules, "3")
+
+        imports = pipreqs.get_all_imports(self.project, target_python=current)
+        self.assertNotIn("os", imports)
+        self.assertIn("flask", imports)
+
     def test_get_use_local_only(self):
         """
         Test without checking PyPI, check to see if names of local
@@ -156,6 +743,412 @@ class TestPipreqs(unittest.TestCase):
         for item in imports_with_info:
             self.assertTrue(item["name"].lower() in self.local)
 
+    def test_get_locally_installed_packages(self):
+        """
+        Test that only the metadata directories directly inside sys.path
+        entries are read, with RECORD as a fallback for top_level.txt
+        """
+        files = {
+            "Flask-3.0.0.dist-info/METADATA": "Metadata-Version: 2.1\nName: Flask\nVersion: 3.0.0\n\nName: nope\n",
+            "Flask-3.0.0.dist-info/top_level.txt": "flask\n",
+            "python_dateutil-2.9.0.dist-info/METADATA": "Name: python-dateutil\nVersion: 2.9.0\n",
+            "python_dateutil-2.9.0.dist-info/RECORD": "\n".join(
+                [
+                    "dateutil/__init__.py,sha256=x,1",
+                    "dateutil/tz/tz.py,sha256=x,1",
+                    "six.py,sha256=x,1",
+                    "_speedups.cpython-312-x86_64-linux-gnu.so,sha256=x,1",
+                    "python_dateutil-2.9.0.dist-info/METADATA,,",
+                    "../../bin/dateutil,,",
+                    "__pycache__/six.cpython-312.pyc,,",
+                ]
+            ),
+            "legacy.egg-info/PKG-INFO": "Name: legacy\nVersion: 0.1\n",
+            "legacy.egg-info/top_level.txt": "legacy\ntests\n",
+            "vendor/bundled-1.0.dist-info/top_level.txt": "bundled\n",
+            "vendor/not_top_level.txt": "vendor\n",
+        }
+        with tempfile.TemporaryDirectory() as site_dir:
+            for file_name, content in files.items():
+                file_name = os.path.join(site_dir, file_name)
+                os.makedirs(os.path.dirname(file_name), exist_ok=True)
+                with open(file_name, "w") as f:
+                    f.write(content)
+            with patch.object(sys, "path", [site_dir, site_dir]):
+                packages = pipreqs.get_locally_installed_packages()
+        self.assertEqual(
+            sorted(packages, key=lambda package: package["name"]),
+            [
+                {"name": "Flask", "version": "3.0.0", "exports": ["flask"]},
+                {"name": "legacy", "version": "0.1", "exports": ["legacy"]},
+                {"name": "python-dateutil", "version": "2.9.0", "exports": ["dateutil", "six", "_speedups"]},
+            ],
+        )
+
+    def test_local_environment_snapshot(self):
+        """
+        Test that the local packages are cached until a site directory changes
+        """
+        def add_distribution(site_dir, name):
+            metadata_dir = os.path.join(site_dir, name + "-1.0.dist-info")
+            os.makedirs(metadata_dir)
+            with open(os.path.join(metadata_dir, "top_level.txt"), "w") as f:
+                f.write(name + "\n")
+            # Do not depend on the resolution of the file system clock
+            os.utime(site_dir, ns=(0, os.stat(site_dir).st_mtime_ns + 10**9))
+
+        with tempfile.TemporaryDirectory() as site_dir, tempfile.TemporaryDirectory() as cache_dir:
+            add_distribution(site_dir, "first")
+            with patch.object(sys, "path", [site_dir]):
+                packages = pipreqs.get_locally_installed_packages(cache_dir=cache_dir)
+                self.assertEqual([package["name"] for package in packages], ["first"])
+
+                with patch.object(pipreqs, "_scan_site_dirs") as scan_mock:
+                    self.assertEqual(pipreqs.get_locally_installed_packages(cache_dir=cache_dir), packages)
+                scan_mock.assert_not_called()
+
+                add_distribution(site_dir, "second")
+                packages = pipreqs.get_locally_installed_packages(cache_dir=cache_dir)
+                self.assertEqual(sorted(package["name"] for package in packages), ["first", "second"])
+
+    def test_local_package_index(self):
+        """
+        Test lookups and deduplication with the local package index
+        """
+        packages = [
+            {"name": "PyYAML", "version": "6.0", "exports": ["_yaml", "yaml"]},
+            {"name": "docopt", "version": "0.6.2", "exports": ["docopt"]},
+            {"name": "attrs", "version": "23.1", "exports": ["attr", "attrs"]},
+            {"name": "docopt", "version": "0.6.2", "exports": ["docopt"]},
+        ]
+        index = pipreqs.LocalPackageIndex(packages)
+        self.assertEqual(
+            pipreqs.get_import_local(["yaml", "docopt", "attr", "attrs", "PyYAML", "missing"], index=index),
+            [packages[3], packages[2], packages[0]],
+        )
+        self.assertTrue(index.provides("Attr"))
+        self.assertFalse(index.provides("PyYAML"))
+        self.assertFalse(index.provides("missing"))
+
+    def test_scanner_threads(self):
+        """
+        Test that one Scanner can scan several projects from many threads at once
+        """
+        projects = [self.project, self.project_with_notebooks, self.project_with_duplicated_deps]
+        with tempfile.TemporaryDirectory() as cache_dir:
+            scanner = pipreqs.Scanner(scan_notebooks=True, cache_dir=cache_dir)
+            expected = {project: sorted(scanner.get_all_imports(project)) for project in projects}
+
+            results = []
+
+            def scan(project):
+                results.append((project, sorted(scanner.get_all_imports(project))))
+
+            threads = [threading.Thread(target=scan, args=(project,)) for project in projects * 4]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(results), len(threads))
+        for project, imports in results:
+            self.assertEqual(imports, expected[project])
+
+    def test_resolver(self):
+        """
+        Test that a Resolver reuses its local index and PyPI session between calls
+        """
+        packages = [{"name": "docopt", "version": "0.6.2", "exports": ["docopt"]}]
+        with patch.object(pipreqs, "get_locally_installed_packages", return_value=packages) as installed:
+            resolver = pipreqs.Resolver(concurrency=2)
+        with patch.object(pipreqs, "get_imports_info", return_value=[{"name": "Flask", "version": "3.0"}]) as info:
+            for _ in range(2):
+                self.assertEqual(
+                    resolver.resolve(["flask", "docopt"]),
+                    [packages[0], {"name": "Flask", "version": "3.0"}],
+                )
+        installed.assert_called_once()
+        self.assertEqual(info.call_args_list[0][0][0], ["Flask"])
+        self.assertIs(info.call_args_list[0][1]["session"], info.call_args_list[1][1]["session"])
+        resolver.close()
+
+    def test_import_index(self):
+        """
+        Test that the import index only parses changed files and matches get_all_imports()
+        """
+        scanner = pipreqs.Scanner()
+        with tempfile.TemporaryDirectory() as project:
+            app = os.path.join(project, "app.py")
+            with open(app, "w") as f:
+                f.write("import flask\nimport os\n")
+            with open(os.path.join(project, "jobs.py"), "w") as f:
+                f.write("import celery\nimport app\n")
+
+            index = pipreqs.ImportIndex(scanner, project)
+            self.assertTrue(index.refresh())
+            self.assertEqual(sorted(index.imports()), sorted(scanner.get_all_imports(project)))
+
+            with patch.object(pipreqs, "imports_from_source", wraps=pipreqs.imports_from_source) as parse_mock:
+                self.assertFalse(index.refresh())
+                with open(app, "w") as f:
+                    f.write("import flask\nimport requests\n")
+                self.assertTrue(index.refresh([app]))
+            parse_mock.assert_called_once()
+            self.assertEqual(sorted(index.imports()), ["celery", "flask", "requests"])
+
+            with open(app, "w") as f:
+                f.write("import flask\nimport (\n")
+            self.assertTrue(index.refresh([app]))
+            self.assertEqual(sorted(index.imports()), ["celery", "flask", "requests"])
+
+            os.remove(app)
+            self.assertTrue(index.refresh([app]))
+            self.assertEqual(sorted(index.imports()), sorted(scanner.get_all_imports(project)))
+
+    def test_import_index_parse_cache(self):
+        """
+        Test that the import index loads the parse cache once, and only
+        when a changed file needs parsing
+        """
+        with tempfile.TemporaryDirectory() as project, tempfile.TemporaryDirectory() as cache_dir:
+            app = os.path.join(project, "app.py")
+            with open(app, "w") as f:
+                f.write("import flask\n")
+            pipreqs.get_all_imports(project, cache_dir=cache_dir)
+
+            index = pipreqs.ImportIndex(pipreqs.Scanner(cache_dir=cache_dir), project)
+            with patch.object(pipreqs.ParseCache, "_load", autospec=True, side_effect=pipreqs.ParseCache._load) as load:
+                with patch.object(pipreqs, "imports_from_source", wraps=pipreqs.imports_from_source) as parse_mock:
+                    self.assertTrue(index.refresh())
+                parse_mock.assert_not_called()
+                self.assertFalse(index.refresh())
+                self.assertFalse(index.refresh())
+                with open(app, "w") as f:
+                    f.write("import flask\nimport requests\n")
+                self.assertTrue(index.refresh())
+            load.assert_called_once()
+            self.assertEqual(sorted(index.imports()), ["flask", "requests"])
+
+    def test_watch_project(self):
+        """
+        Test that watch_project() reports the imports again only when they change
+        """
+        for inotify in [pipreqs._Inotify, Mock(side_effect=OSError("not available"))]:
+            with tempfile.TemporaryDirectory() as project, patch.object(pipreqs, "_Inotify", inotify):
+                app = os.path.join(project, "app.py")
+                with open(app, "w") as f:
+                    f.write("import flask\n")
+                changes = []
+                changed = threading.Event()
+                stop = threading.Event()
+
+                def on_change(imports):
+                    changes.append(imports)
+                    changed.set()
+
+                thread = threading.Thread(
+                    target=pipreqs.watch_project, args=(project, pipreqs.Scanner(), on_change, 0.05, stop)
+                )
+                thread.start()
+                try:
+                    self.assertTrue(changed.wait(5))
+                    changed.clear()
+                    with open(app, "w") as f:
+                        f.write("import flask  # unchanged imports\n")
+                    os.mkdir(os.path.join(project, "pkg"))
+                    with open(os.path.join(project, "pkg", "models.py"), "w") as f:
+                        f.write("import sqlalchemy\n")
+                    self.assertTrue(changed.wait(5))
+                finally:
+                    stop.set()
+                    thread.join()
+                self.assertEqual(changes, [["flask"], ["flask", "sqlalchemy"]])
+
+    def _make_monorepo(self, root):
+        files = {
+            "services/api/setup.py": "import setuptools\n",
+            "services/api/app.py": "import flask\nimport api_utils\n",
+            "services/api/api_utils.py": "import docopt\n",
+            "services/worker/pyproject.toml": "",
+            "services/worker/tasks.py": "import celery\nimport docopt\n",
+            "services/worker/plugins/requirements.txt": "",
+            "services/worker/plugins/plugin.py": "import numpy\nimport tasks\n",
+            "tools/script.py": "import click\n",
+        }
+        for name, contents in files.items():
+            os.makedirs(os.path.join(root, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(root, name), "w") as f:
+                f.write(contents)
+        return {
+            name: os.path.join(root, "services", *name.split("/"))
+            for name in ["api", "worker", "worker/plugins"]
+        }
+
+    def test_get_project_imports(self):
+        """
+        Test that get_project_imports() splits the imports of one walk between the projects
+        """
+        with tempfile.TemporaryDirectory() as root:
+            projects = self._make_monorepo(root)
+            scanner = pipreqs.Scanner()
+            self.assertEqual(
+                scanner.get_project_imports(root),
+                {
+                    projects["api"]: ["docopt", "flask", "setuptools"],
+                    projects["worker"]: ["celery", "docopt"],
+                    projects["worker/plugins"]: ["numpy", "tasks"],
+                },
+            )
+            self.assertEqual(
+                scanner.get_project_imports(root)[projects["api"]],
+                sorted(scanner.get_all_imports(projects["api"])),
+            )
+
+    def test_resolve_projects(self):
+        """
+        Test that resolve_projects() looks up each package once for all projects
+        """
+        packages = [{"name": "docopt", "version": "0.6.2", "exports": ["docopt"]}]
+        flask = {"name": "Flask", "version": "3.0"}
+        with patch.object(pipreqs, "get_locally_installed_packages", return_value=packages):
+            resolver = pipreqs.Resolver()
+        with patch.object(pipreqs, "get_imports_info", return_value=[flask]) as info:
+            self.assertEqual(
+                resolver.resolve_projects({"api": ["flask", "docopt"], "worker": ["flask"], "docs": []}),
+                {"api": [packages[0], flask], "worker": [flask], "docs": []},
+            )
+        info.assert_called_once()
+        self.assertEqual(info.call_args[0][0], ["Flask"])
+        resolver.close()
+
+    def test_init_projects(self):
+        """
+        Test that --projects writes a requirements file in each project
+        """
+        with tempfile.TemporaryDirectory() as root:
+            projects = self._make_monorepo(root)
+            pipreqs.init(
+                {
+                    "<path>": root,
+                    "--savepath": None,
+                    "--print": False,
+                    "--use-local": True,
+                    "--force": True,
+                    "--proxy": None,
+                    "--pypi-server": None,
+                    "--diff": None,
+                    "--clean": None,
+                    "--mode": "no-pin",
+                    "--projects": True,
+                    "--no-cache": True,
+                }
+            )
+            requirements = {}
+            for name, project in projects.items():
+                with open(os.path.join(project, "requirements.txt")) as f:
+                    requirements[name] = f.read().lower().split()
+            self.assertFalse(os.path.exists(os.path.join(root, "requirements.txt")))
+        self.assertEqual(requirements["api"], ["docopt"])
+        self.assertEqual(requirements["worker"], ["docopt"])
+        self.assertEqual(requirements["worker/plugins"], [])
+
+    def test_profile(self):
+        """
+        Test that a Profile records the walk, the files parsed and the PyPI requests
+        """
+        profile = pipreqs.Profile(slowest=1)
+        scanner = pipreqs.Scanner(profile=profile)
+        imports = scanner.get_all_imports(self.project)
+        report = profile.report()
+        self.assertEqual(sorted(imports), sorted(pipreqs.Scanner().get_all_imports(self.project)))
+        self.assertEqual(report["phases"]["walk"]["files"], report["phases"]["read"]["files"])
+        self.assertGreater(report["phases"]["read"]["bytes"], 0)
+        self.assertGreater(report["phases"]["parse"]["wall_time"], 0)
+        self.assertEqual(len(report["slowest_files"]), 1)
+
+        # The workers of a process pool report their files too
+        parallel_profile = pipreqs.Profile()
+        pipreqs.Scanner(jobs=2, profile=parallel_profile).get_all_imports(self.project)
+        parallel_report = parallel_profile.report()
+        self.assertEqual(parallel_report["phases"]["read"]["files"], report["phases"]["read"]["files"])
+        self.assertEqual(parallel_report["phases"]["read"]["bytes"], report["phases"]["read"]["bytes"])
+
+        def fake_get(session, url, **kwargs):
+            if "missing" in url:
+                return Mock(status_code=404, reason="Not Found")
+            payload = {"info": {"name": "Flask", "version": "3.0.0", "package_url": url}, "releases": {}}
+            return Mock(status_code=200, content=json.dumps(payload).encode())
+
+        with patch.object(requests.Session, "get", autospec=True, side_effect=fake_get):
+            pipreqs.get_imports_info(["flask", "missing", "django"], profile=profile)
+        http = profile.report()["http"]
+        self.assertEqual(http["requests"], 3)
+        self.assertEqual(http["statuses"], {"200": 2, "404": 1})
+        self.assertLessEqual(http["latency"]["p50"], http["latency"]["max"])
+
+    def test_profile_phases_exclude_nested_phases(self):
+        """
+        Test that the time of a phase leaves out the phases nested in it
+        """
+        profile = pipreqs.Profile()
+        with profile.phase("outer"):
+            with profile.phase("inner"):
+                time.sleep(0.05)
+        phases = profile.report()["phases"]
+        self.assertGreaterEqual(phases["inner"]["wall_time"], 0.05)
+        self.assertLess(phases["outer"]["wall_time"], 0.05)
+
+    def test_init_profile(self):
+        """
+        Test that --profile and --cprofile write their reports
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            profile_file = os.path.join(tmp, "profile.json")
+            stats_file = os.path.join(tmp, "profile.prof")
+            with patch("sys.stdout", new_callable=StringIO):
+                pipreqs.init(
+                    {
+                        "<path>": self.project,
+                        "--savepath": None,
+                        "--print": True,
+                        "--use-local": True,
+                        "--force": False,
+                        "--proxy": None,
+                        "--pypi-server": None,
+                        "--diff": None,
+                        "--clean": None,
+                        "--mode": None,
+                        "--no-cache": True,
+                        "--profile": profile_file,
+                        "--cprofile": stats_file,
+                    }
+                )
+            with open(profile_file) as f:
+                report = json.load(f)
+            self.assertEqual(
+                sorted(report["phases"]), ["local_packages", "local_resolve", "parse", "read", "walk"]
+            )
+            self.assertEqual(report["http"]["requests"], 0)
+            import pstats
+
+            self.assertIn("_init", [function for _, _, function in pstats.Stats(stats_file).stats])
+
+    def test_docopt_options(self):
+        """
+        Test that docopt parses every option of the usage text on its own
+        """
+        from docopt import docopt, parse_defaults
+
+        options = parse_defaults(pipreqs.__doc__)
+        longs = [option.long for option in options]
+        self.assertEqual(len(longs), len(set(longs)))
+        for option in options:
+            with self.subTest(option=option.long):
+                argv = [option.long, "value"] if option.argcount else [option.long]
+                args = docopt(pipreqs.__doc__, argv=argv + ["project"])
+                self.assertEqual(args[option.long], "value" if option.argcount else True)
+                self.assertEqual(args["<path>"], "project")
+
     def test_init(self):
         """
         Test that all modules we will test upon are in requirements file
@@ -558,9 +1551,160 @@ class TestPipreqs(unittest.TestCase):
         """
         Test the function ipynb_2_py() which converts .ipynb file to .py format
         """
+        self.mock_scan_notebooks()
         python_imports = pipreqs.get_all_imports(self.python_path_same_imports)
-        notebook_imports = pipreqs.get_all_imports(self.notebook_path_same_imports)
-        self.assertEqual(python_imports, notebook_imports)
+        with patch.object(pipreqs, "use_nbconvert", True):
+            with patch.object(pipreqs, "ipynb_2_py", wraps=pipreqs.ipynb_2_py) as convert:
+                notebook_imports = pipreqs.get_all_imports(self.notebook_path_same_imports)
+        convert.assert_called_once()
+        self.assertEqual(convert.call_args[0][0], self.notebook_path_same_imports)
+        # The notebook has the imports of test.py but analytics and flask_seasurf
+        self.assertEqual(sorted(notebook_imports), sorted(set(python_imports) - {"analytics", "flask_seasurf"}))
+
+    def test_notebook_to_python(self):
+        """
+        Test that notebook_to_python() translates IPython syntax and only keeps code cells
+        """
+        cells = [
+            {"cell_type": "markdown", "source": ["import markdown_module\n"]},
+            {"cell_type": "code", "source": ["%matplotlib inline\n", "!pip install \\\n", "    shell_module\n",
+                                             "import numpy\n"]},
+            {"cell_type": "code", "source": "files = !ls\nos?\nif files:\n    !echo yes\n    import pandas"},
+            {"cell_type": "code", "source": ["%%bash\n", "import bash_module\n"]},
+            {"cell_type": "code", "source": ["%%time\n", "import scipy\n"]},
+            {"cell_type": "raw", "source": ["import raw_module\n"]},
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            file_name = os.path.join(tmp, "magics.ipynb")
+            with open(file_name, "w") as f:
+                json.dump({"cells": cells, "metadata": {}, "nbformat": 4, "nbformat_minor": 4}, f)
+            source = pipreqs.notebook_to_python(file_name)
+
+        self.assertEqual(pipreqs.imports_from_source(source), {"numpy", "pandas", "scipy"})
+
+    def test_notebook_to_python_matches_nbconvert(self):
+        """
+        Test that the built-in notebook extractor finds the same imports as nbconvert
+        """
+        for file_name in os.listdir(self.project_with_notebooks):
+            if not file_name.endswith(".ipynb"):
+                continue
+            file_name = os.path.join(self.project_with_notebooks, file_name)
+            self.assertEqual(
+                pipreqs.imports_from_source(pipreqs.notebook_to_python(file_name)),
+                pipreqs.imports_from_source(pipreqs.ipynb_2_py(file_name)),
+            )
+
+    def test_json_reader(self):
+        """
+        Test that JsonReader reads and skips values split across chunks
+        """
+        document = {
+            "text": 'quote " backslash \\ unicode é 😀',
+            "numbers": [0, -1.5e3, 10, True, False, None],
+            "nested": {"empty": {}, "list": [[], [{}], "]}"]},
+            "last": "value",
+        }
+        for chunk_size in [1, 2, 3, 7, 1 << 16]:
+            reader = pipreqs.JsonReader(StringIO(json.dumps(document, indent=1)), chunk_size)
+            read = {}
+            for key in reader.iter_object():
+                if key == "nested":
+                    reader.skip_value()
+                else:
+                    read[key] = reader.read_value()
+            self.assertEqual(read, {key: value for key, value in document.items() if key != "nested"})
+
+    def test_scan_memory_bounded_by_distinct_names(self):
+        """
+        Test that the peak memory of a scan without parse cache grows with
+        the number of distinct names, not with the number of files
+        """
+        try:
+            import tracemalloc
+        except ImportError:
+            self.skipTest("tracemalloc is not available")
+
+        def scan_peak(files):
+            with tempfile.TemporaryDirectory() as project:
+                for index in range(files):
+                    # Every path is distinct, but made of the same few names
+                    directory = os.path.join(project, *["pkg{}".format(digit) for digit in "{:05o}".format(index)])
+                    os.makedirs(directory, exist_ok=True)
+                    with open(os.path.join(directory, "module{}.py".format(index % 8)), "w") as f:
+                        f.write("import os\nimport numpy.linalg\nfrom django.db import models\n")
+                        f.write("import lib{}.sub\nfrom . import sibling\n".format(index % 16))
+                tracemalloc.start()
+                try:
+                    imports = pipreqs.Scanner().get_all_imports(project)
+                    _, peak = tracemalloc.get_traced_memory()
+                finally:
+                    tracemalloc.stop()
+            self.assertEqual(len(imports), 18)
+            return peak
+
+        # Leave out the tables loaded by the first scan
+        pipreqs.Scanner().get_all_imports(self.project)
+        small, large = scan_peak(250), scan_peak(2000)
+        self.assertLess(large, small * 1.5)
+
+    def test_notebook_outputs_not_loaded(self):
+        """
+        Test that reading a notebook does not load its cell outputs into memory
+        """
+        try:
+            import tracemalloc
+        except ImportError:
+            self.skipTest("tracemalloc is not available")
+        cell = {
+            "cell_type": "code",
+            "attachments": {"image.png": {"image/png": "A" * 2 ** 20}},
+            "outputs": [{"output_type": "display_data", "data": {"image/png": "B" * 4 * 2 ** 20}}],
+            "source": ["import numpy\n"],
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            file_name = os.path.join(tmp, "outputs.ipynb")
+            with open(file_name, "w") as f:
+                json.dump({"cells": [cell] * 4, "metadata": {}, "nbformat": 4, "nbformat_minor": 4}, f)
+            tracemalloc.start()
+            try:
+                source = pipreqs.notebook_to_python(file_name)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+        self.assertEqual(pipreqs.imports_from_source(source), {"numpy"})
+        self.assertLess(peak, 2 ** 20)
+
+    def test_notebook_pool(self):
+        """
+        Test that parse_imports_notebook_pool() finds the same imports as parse_imports()
+        """
+        self.mock_scan_notebooks()
+        file_names = [
+            os.path.join(self.project_with_notebooks, file_name)
+            for file_name in sorted(os.listdir(self.project_with_notebooks))
+            if file_name.endswith((".py", ".ipynb"))
+        ]
+        with patch.object(pipreqs, "use_nbconvert", True):
+            expected = pipreqs.parse_imports(file_names)
+            file_imports = pipreqs.parse_imports_notebook_pool(file_names, jobs=2)
+        self.assertEqual(file_imports, expected)
+
+    def test_python_exporter_reused(self):
+        """
+        Test that ipynb_2_py() converts every notebook of a thread with the same exporter
+        """
+        pipreqs.ipynb_2_py(self.notebook_path_same_imports)
+        exporter = pipreqs._python_exporter()
+        pipreqs.ipynb_2_py(self.notebook_path_same_imports)
+        self.assertIs(pipreqs._python_exporter(), exporter)
+
+        exporters = []
+        thread = threading.Thread(target=lambda: exporters.append(pipreqs._python_exporter()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(exporters[0], exporter)
 
     def test_file_ext_is_allowed(self):
         """
@@ -675,14 +1819,56 @@ class TestPipreqs(unittest.TestCase):
 
         os.remove(requirements_path)
 
+    @unittest.skipIf(platform.python_implementation() != "CPython", "-X importtime is specific to CPython")
+    def test_startup_time(self):
+        """
+        Test that importing pipreqs stays within budget and does not load
+        dependencies that only some code paths need
+        """
+        env = dict(os.environ)
+        # Measure the usual case, where the bytecode is already compiled
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        timings = []
+        for _ in range(3):
+            stderr = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", "import pipreqs.pipreqs"],
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stderr
+            imported = {}
+            for line in stderr.splitlines():
+                # import time: <self us> | <cumulative us> | <module>
+                fields = line.split(":", 1)[-1].split("|")
+                if len(fields) == 3 and fields[1].strip().isdigit():
+                    imported[fields[2].strip()] = int(fields[1])
+            timings.append(imported["pipreqs.pipreqs"])
+
+        for module in ["requests", "yarg", "docopt", "nbconvert", "IPython", "concurrent.futures.process"]:
+            self.assertNotIn(module, imported)
+        self.assertLess(min(timings), STARTUP_BUDGET_US)
+
     def mock_scan_notebooks(self):
         pipreqs.scan_noteboooks = Mock(return_value=True)
         pipreqs.handle_scan_noteboooks()
 
+    def setUp(self):
+        # Keep the caches of the runs with the default cache directory
+        # (as the CLI uses) out of the user's own cache directory.
+        self.cache_home = tempfile.mkdtemp()
+        self.cache_home_patch = patch.dict(
+            os.environ, {"XDG_CACHE_HOME": self.cache_home, "LOCALAPPDATA": self.cache_home}
+        )
+        self.cache_home_patch.start()
+
     def tearDown(self):
         """
         Remove requiremnts.txt files that were written
         """
+        self.cache_home_patch.stop()
+        shutil.rmtree(self.cache_home, ignore_errors=True)
         try:
             os.remove(self.requirements_path)
         except OSError:
@@ -691,6 +1877,10 @@ class TestPipreqs(unittest.TestCase):
             os.remove(self.alt_requirement_path)
         except OSError:
             pass
+        try:
+            os.remove(os.path.join(self.project_with_notebooks, "requirements.txt"))
+        except OSError:
+            pass
 
 
 if __name__ == "__main__":